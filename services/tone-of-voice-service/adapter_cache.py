@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class AdapterCache:
+    """
+    Bounded LRU cache of loaded adapters, keyed per user/account.
+
+    Entries are evicted least-recently-used first once either the entry limit
+    or the memory budget is exceeded. Pinned keys and entries currently in use
+    by a request are never evicted. on_evict(key, entry) is called for every
+    entry that leaves the cache, so the caller can free the adapter weights.
+
+    replace() swaps in a newer adapter for a key; requests still using the
+    old entry keep it until they release it, and only then is it evicted.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, pinned=(), on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.pinned = set(pinned)
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._retired = []  # (key, entry) replaced while still in use
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def acquire(self, key: str):
+        """
+        Returns the entry for key and marks it in use, or None on a miss.
+        Every successful acquire must be paired with release(key, entry).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            entry["last_used"] = time.time()
+            entry["in_use"] += 1
+            return entry
+
+    def peek(self, key: str):
+        """Returns the entry for key without acquiring it or counting a lookup"""
+        with self._lock:
+            return self._entries.get(key)
+
+    def release(self, key: str, entry: dict = None):
+        retired = None
+        with self._lock:
+            current = self._entries.get(key)
+            if entry is None or entry is current:
+                if current is not None and current["in_use"] > 0:
+                    current["in_use"] -= 1
+            elif entry["in_use"] > 0:
+                # The entry was replaced while in use; evict it once the last user is done
+                entry["in_use"] -= 1
+                if entry["in_use"] == 0:
+                    self._retired = [(k, e) for k, e in self._retired if e is not entry]
+                    retired = entry
+        if retired is not None and self.on_evict:
+            self.on_evict(key, retired)
+        self._evict()
+
+    def put(self, key: str, model, tokenizer, nbytes: int, in_use: bool = False, **info):
+        """
+        Inserts a loaded adapter, evicting older entries if over budget.
+        With in_use=True the entry is returned already acquired.
+        Extra keyword arguments (e.g. the adapter version) are stored in the entry.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # A concurrent request may have inserted the same adapter already
+                entry = {
+                    "model": model,
+                    "tokenizer": tokenizer,
+                    "nbytes": nbytes,
+                    "loaded_at": now,
+                    "last_used": now,
+                    "in_use": 0,
+                    **info,
+                }
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            entry["last_used"] = now
+            if in_use:
+                entry["in_use"] += 1
+        self._evict()
+        return entry
+
+    def replace(self, key: str, model, tokenizer, nbytes: int, in_use: bool = False, **info):
+        """
+        Swaps in a newly loaded adapter for key, retiring the previous entry.
+        With in_use=True the new entry is returned already acquired.
+        """
+        now = time.time()
+        entry = {
+            "model": model,
+            "tokenizer": tokenizer,
+            "nbytes": nbytes,
+            "loaded_at": now,
+            "last_used": now,
+            "in_use": 1 if in_use else 0,
+            **info,
+        }
+        with self._lock:
+            old = self._entries.get(key)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if old is not None and old["in_use"] > 0:
+                self._retired.append((key, old))
+                old = None
+        if old is not None and self.on_evict:
+            self.on_evict(key, old)
+        self._evict()
+        return entry
+
+    def pop(self, key: str):
+        """Removes key from the cache (e.g. after retraining)"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None and self.on_evict:
+            self.on_evict(key, entry)
+        return entry
+
+    def pin(self, key: str):
+        with self._lock:
+            self.pinned.add(key)
+
+    def unpin(self, key: str):
+        with self._lock:
+            self.pinned.discard(key)
+        self._evict()
+
+    def _total_bytes(self) -> int:
+        return sum(entry["nbytes"] for entry in self._entries.values())
+
+    def _evict(self):
+        evicted = []
+        with self._lock:
+            for key in list(self._entries):
+                if len(self._entries) <= self.max_entries and self._total_bytes() <= self.max_bytes:
+                    break
+                entry = self._entries[key]
+                if key in self.pinned or entry["in_use"] > 0:
+                    continue
+                del self._entries[key]
+                self.evictions += 1
+                evicted.append((key, entry))
+        for key, entry in evicted:
+            print(f"Evicting adapter {key} from cache")
+            if self.on_evict:
+                self.on_evict(key, entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "resident_mb": round(self._total_bytes() / 2**20, 1),
+                "max_mb": round(self.max_bytes / 2**20, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "retired_in_use": len(self._retired),
+            }
+
+    def resident(self) -> list:
+        """Resident entries, most recently used last"""
+        with self._lock:
+            return [
+                {
+                    "key": key,
+                    "version": entry.get("version"),
+                    "size_mb": round(entry["nbytes"] / 2**20, 1),
+                    "pinned": key in self.pinned,
+                    "in_use": entry["in_use"],
+                    "loaded_at": entry["loaded_at"],
+                    "last_used": entry["last_used"],
+                }
+                for key, entry in self._entries.items()
+            ]
@@ -0,0 +1,106 @@
+"""
+Layout of an account's adapter directory:
+
+    outputs/tone_of_voice_lora/{user}_{account}/
+        versions/v1/, v2/, ...   one complete adapter per training run
+        CURRENT                  name of the published version
+        checkpoints/             Trainer checkpoints of the latest run
+
+Training saves into a fresh version directory and only then replaces CURRENT
+(atomically, via os.replace), so readers never see a half-written adapter.
+"""
+import os
+import shutil
+from pathlib import Path
+
+ADAPTER_ROOT = Path("outputs/tone_of_voice_lora")
+
+# Published adapter versions kept per account, the current one included
+ADAPTER_KEEP_VERSIONS = int(os.getenv("ADAPTER_KEEP_VERSIONS", 2))
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+# Adapters saved before versioning live directly in the account directory
+LEGACY_VERSION = "legacy"
+
+
+def account_dir(key: str) -> Path:
+    """Adapter directory of a userId_accountId key"""
+    return ADAPTER_ROOT / key
+
+
+def version_path(adapter_dir: Path, version: str) -> Path:
+    if version == LEGACY_VERSION:
+        return Path(adapter_dir)
+    return Path(adapter_dir) / VERSIONS_DIR / version
+
+
+def current_version(adapter_dir: Path) -> str:
+    """The published adapter version, or None if the account has no adapter"""
+    adapter_dir = Path(adapter_dir)
+    try:
+        version = (adapter_dir / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        version = None
+    if version and (version_path(adapter_dir, version) / "adapter_config.json").exists():
+        return version
+    if (adapter_dir / "adapter_config.json").exists():
+        return LEGACY_VERSION
+    return None
+
+
+def current_adapter(adapter_dir: Path):
+    """(version, path) of the published adapter, or (None, None)"""
+    version = current_version(adapter_dir)
+    if version is None:
+        return None, None
+    return version, version_path(adapter_dir, version)
+
+
+def new_version_dir(adapter_dir: Path):
+    """Creates the directory for the next version; returns (version, path)"""
+    versions_dir = Path(adapter_dir) / VERSIONS_DIR
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    numbers = [int(path.name[1:]) for path in versions_dir.glob("v*") if path.name[1:].isdigit()]
+    number = max(numbers, default=0) + 1
+    while True:
+        version = f"v{number}"
+        try:
+            (versions_dir / version).mkdir()
+            return version, versions_dir / version
+        except FileExistsError:
+            number += 1
+
+
+def publish_version(adapter_dir: Path, version: str):
+    """Points CURRENT at a fully written version"""
+    current_path = Path(adapter_dir) / CURRENT_FILE
+    temp_path = current_path.with_name(f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with temp_path.open("w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, current_path)
+
+
+def remove_old_versions(adapter_dir: Path, keep: int = ADAPTER_KEEP_VERSIONS) -> list:
+    """
+    Deletes all but the newest `keep` versions, never the current one.
+    The previous version is kept by default, since a server may still be
+    serving it until the new one has been loaded.
+    """
+    versions_dir = Path(adapter_dir) / VERSIONS_DIR
+    if not versions_dir.exists():
+        return []
+    current = current_version(adapter_dir)
+    versions = sorted(
+        (path for path in versions_dir.glob("v*") if path.name[1:].isdigit()),
+        key=lambda path: int(path.name[1:]),
+        reverse=True,
+    )
+    removed = []
+    for path in versions[max(keep, 1):]:
+        if path.name != current:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path.name)
+    return removed
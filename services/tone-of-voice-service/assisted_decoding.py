@@ -0,0 +1,126 @@
+import torch
+from transformers import (
+    LogitsProcessorList,
+    MinLengthLogitsProcessor,
+    NoRepeatNGramLogitsProcessor,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+
+# Generation settings the assisted loop knows how to apply
+SUPPORTED_SETTINGS = {
+    "max_new_tokens", "min_length", "do_sample", "temperature", "top_p", "top_k",
+    "repetition_penalty", "no_repeat_ngram_size",
+}
+
+
+def prompt_lookup_candidates(ids: list, max_ngram: int, num_tokens: int) -> list:
+    """
+    Proposes the tokens that followed the most recent earlier occurrence of
+    the sequence's last n tokens, trying the longest n-gram first. A revision
+    mostly copies the draft, so these are often exactly what comes next.
+    """
+    for n in range(min(max_ngram, len(ids) - 1), 0, -1):
+        tail = ids[-n:]
+        for start in range(len(ids) - n - 1, -1, -1):
+            if ids[start:start + n] == tail:
+                return ids[start + n:start + n + num_tokens]
+    return []
+
+
+def sampling_processors(settings: dict, eos_token_id: int):
+    """(processors, warpers) equivalent to what generate() builds from settings, in the same order"""
+    unsupported = set(settings) - SUPPORTED_SETTINGS
+    if unsupported:
+        raise ValueError(f"Assisted decoding does not support generation settings: {', '.join(sorted(unsupported))}")
+    processors = LogitsProcessorList()
+    if settings.get("repetition_penalty", 1.0) != 1.0:
+        processors.append(RepetitionPenaltyLogitsProcessor(settings["repetition_penalty"]))
+    if settings.get("no_repeat_ngram_size"):
+        processors.append(NoRepeatNGramLogitsProcessor(settings["no_repeat_ngram_size"]))
+    if settings.get("min_length"):
+        processors.append(MinLengthLogitsProcessor(settings["min_length"], eos_token_id))
+    warpers = LogitsProcessorList()
+    if settings.get("do_sample"):
+        if settings.get("temperature", 1.0) != 1.0:
+            warpers.append(TemperatureLogitsWarper(settings["temperature"]))
+        if settings.get("top_k"):
+            warpers.append(TopKLogitsWarper(settings["top_k"]))
+        if settings.get("top_p", 1.0) < 1.0:
+            warpers.append(TopPLogitsWarper(settings["top_p"]))
+    return processors, warpers
+
+
+def crop_past_key_values(past_key_values, length: int):
+    return tuple(tuple(state[:, :, :length] for state in layer) for layer in past_key_values)
+
+
+def assisted_generate(model, input_ids, settings: dict, eos_token_id: int, past_key_values=None,
+                      logits_processor=(), stopping_criteria=None, max_ngram: int = 3, num_candidates: int = 10):
+    """
+    Generates one sequence with prompt-lookup assisted decoding.
+
+    Each step proposes up to num_candidates tokens by prompt lookup and
+    scores them all in one forward pass. The model's own choice is then
+    taken position by position (sampled or greedy, after the same logits
+    processors and warpers generate() would apply) for as long as it agrees
+    with the proposal, plus the first token where it differs. The output
+    therefore follows the same distribution as plain decoding; greedy
+    decoding gives identical tokens.
+
+    input_ids is a [1, length] tensor; past_key_values may hold a prefix of
+    it (e.g. the cached prompt preamble). logits_processor runs after the
+    sampling processors, like generate()'s logits_processor argument.
+    Returns (output_ids, stats).
+    """
+    processors, warpers = sampling_processors(settings, eos_token_id)
+    processors.extend(logits_processor)
+    do_sample = settings.get("do_sample", False)
+    max_new_tokens = settings.get("max_new_tokens", 20)
+
+    ids = input_ids[0].tolist()
+    prompt_length = len(ids)
+    cached = past_key_values[0][0].shape[2] if past_key_values is not None else 0
+    pending = ids[cached:]  # Tokens the cache doesn't cover yet
+    stats = {"steps": 0, "proposed": 0, "accepted": 0}
+
+    while len(ids) - prompt_length < max_new_tokens:
+        remaining = max_new_tokens - (len(ids) - prompt_length)
+        candidates = prompt_lookup_candidates(ids, max_ngram, min(num_candidates, remaining - 1))
+        outputs = model(
+            input_ids=torch.tensor([pending + candidates], device=input_ids.device),
+            past_key_values=past_key_values,
+            use_cache=True,
+        )
+        logits = outputs.logits[0, -(len(candidates) + 1):].float()
+
+        new_tokens = []
+        for i in range(len(candidates) + 1):
+            sequence = torch.tensor([ids + new_tokens], device=input_ids.device)
+            scores = processors(sequence, logits[i:i + 1])
+            if do_sample:
+                scores = warpers(sequence, scores)
+                token = int(torch.multinomial(scores.softmax(dim=-1), num_samples=1))
+            else:
+                token = int(scores.argmax(dim=-1))
+            new_tokens.append(token)
+            if i == len(candidates) or token != candidates[i]:
+                break
+            stats["accepted"] += 1
+            if token == eos_token_id:
+                break
+
+        stats["steps"] += 1
+        stats["proposed"] += len(candidates)
+        ids.extend(new_tokens)
+        if new_tokens[-1] == eos_token_id:
+            break
+        if stopping_criteria is not None and stopping_criteria(torch.tensor([ids], device=input_ids.device), None):
+            break
+        # The cache now covers everything but the newest token, which is fed next step
+        past_key_values = crop_past_key_values(outputs.past_key_values, len(ids) - 1)
+        pending = ids[-1:]
+
+    return torch.tensor([ids], device=input_ids.device), stats
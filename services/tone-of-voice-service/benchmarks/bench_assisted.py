@@ -0,0 +1,86 @@
+"""
+Compares prompt-lookup assisted decoding (ASSISTED_DECODING=prompt-lookup)
+with plain decoding on the fixed draft corpus, one draft at a time: decode
+tokens/sec, the share of proposed tokens the model accepted, and whether the
+cleaned revisions match. Greedy by default, where both modes must produce
+identical revisions; --sample uses the service's sampling settings.
+
+Usage: python benchmarks/bench_assisted.py <adapter_path> [--sample] [--seed 0]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import torch
+from prometheus_client import REGISTRY
+
+import revise_response
+
+DRAFTS = json.loads((Path(__file__).parent / "drafts.json").read_text(encoding="utf-8"))
+
+
+def assisted_tokens(result: str) -> float:
+    return REGISTRY.get_sample_value("assisted_decoding_tokens_total", {"result": result}) or 0.0
+
+
+def run_corpus(model, tokenizer, adapter_name: str, mode: str, seed: int) -> dict:
+    revise_response.ASSISTED_DECODING = mode
+    proposed, accepted = assisted_tokens("proposed"), assisted_tokens("accepted")
+    revisions = []
+    generated_tokens = 0
+    start = time.perf_counter()
+    for index, draft in enumerate(DRAFTS):
+        torch.manual_seed(seed + index)
+        prompt = revise_response.build_prompt(draft)
+        outputs, prompt_length = revise_response.generate_revisions([prompt], model, tokenizer, adapter_name=adapter_name)
+        generated_tokens += int((outputs[0, prompt_length:] != tokenizer.eos_token_id).sum())
+        revisions.append(revise_response.clean_revision(tokenizer.decode(outputs[0], skip_special_tokens=True), prompt))
+    elapsed = time.perf_counter() - start
+    proposed = assisted_tokens("proposed") - proposed
+    accepted = assisted_tokens("accepted") - accepted
+    return {
+        "generated_tokens": generated_tokens,
+        "elapsed_s": round(elapsed, 3),
+        "tokens_per_second": round(generated_tokens / elapsed, 2),
+        "proposed_tokens": int(proposed),
+        "accepted_tokens": int(accepted),
+        "acceptance_rate": round(accepted / proposed, 3) if proposed else 0.0,
+        "revisions": revisions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("adapter_path")
+    parser.add_argument("--sample", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not args.sample:
+        revise_response.GENERATION_SETTINGS = {**revise_response.GENERATION_SETTINGS, "do_sample": False}
+
+    adapter_name = Path(args.adapter_path).name
+    model, tokenizer = revise_response.load_adapter(adapter_name, args.adapter_path)
+
+    plain = run_corpus(model, tokenizer, adapter_name, "off", args.seed)
+    assisted = run_corpus(model, tokenizer, adapter_name, "prompt-lookup", args.seed)
+
+    matching = sum(a == b for a, b in zip(plain.pop("revisions"), assisted.pop("revisions")))
+    for key in ("proposed_tokens", "accepted_tokens", "acceptance_rate"):
+        plain.pop(key)
+    print(json.dumps({
+        "drafts": len(DRAFTS),
+        "sampling": args.sample,
+        "plain": plain,
+        "prompt_lookup": assisted,
+        "speedup": round(assisted["tokens_per_second"] / plain["tokens_per_second"], 2) if plain["tokens_per_second"] else 0.0,
+        "identical_revisions": matching,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
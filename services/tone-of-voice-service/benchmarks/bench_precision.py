@@ -0,0 +1,106 @@
+"""
+Compares inference precision modes (INFERENCE_PRECISION) on the fixed draft
+corpus: model memory, peak RSS, load time, decode tokens/sec, and how
+closely the greedy revisions match the fp32 ones.
+
+Each mode runs in its own process, since the precision is chosen at import.
+
+Usage: python benchmarks/bench_precision.py <adapter_path> [--modes auto,bf16,int8,int8-merged]
+"""
+import argparse
+import difflib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+DRAFTS = json.loads((Path(__file__).parent / "drafts.json").read_text(encoding="utf-8"))
+
+
+def run_mode(adapter_path: str) -> dict:
+    """Runs in the child process, with INFERENCE_PRECISION already set"""
+    import revise_response
+    from quantization import module_nbytes
+
+    # Greedy decoding, so differences come from the weights alone
+    revise_response.GENERATION_SETTINGS = {**revise_response.GENERATION_SETTINGS, "do_sample": False}
+
+    export_s = None
+    if revise_response.INFERENCE_PRECISION == "int8-merged":
+        # Done by the training job when serving, so not counted in the load time
+        start = time.perf_counter()
+        revise_response.export_merged_model(adapter_path)
+        export_s = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    model, tokenizer = revise_response.load_adapter("bench", adapter_path)
+    load_s = time.perf_counter() - start
+
+    revisions = []
+    generated_tokens = 0
+    start = time.perf_counter()
+    for draft in DRAFTS:
+        prompt = revise_response.build_prompt(draft)
+        outputs, prompt_length = revise_response.generate_revisions([prompt], model, tokenizer, adapter_name="bench")
+        generated_tokens += int((outputs[0, prompt_length:] != tokenizer.eos_token_id).sum())
+        revisions.append(revise_response.clean_revision(tokenizer.decode(outputs[0], skip_special_tokens=True), prompt))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "precision": revise_response.INFERENCE_PRECISION,
+        "model_mb": round(module_nbytes(model) / 2**20, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "load_s": round(load_s, 3),
+        "export_s": export_s,
+        "tokens_per_second": round(generated_tokens / elapsed, 2),
+        "revisions": revisions,
+    }
+
+
+def similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("adapter_path")
+    parser.add_argument("--modes", default="auto,bf16,int8,int8-merged")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.adapter_path)))
+        return
+
+    results = {}
+    for mode in args.modes.split(","):
+        # A private copy, so the int8-merged export starts from scratch and stays out of the adapter dir
+        with tempfile.TemporaryDirectory() as workdir:
+            adapter_copy = Path(workdir) / "adapter"
+            shutil.copytree(args.adapter_path, adapter_copy)
+            output = subprocess.run(
+                [sys.executable, __file__, str(adapter_copy), "--child"],
+                env={**os.environ, "INFERENCE_PRECISION": mode},
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    reference = results[args.modes.split(",")[0]]["revisions"]
+    for mode, result in results.items():
+        revisions = result.pop("revisions")
+        result["exact_match"] = round(sum(a == b for a, b in zip(reference, revisions)) / len(DRAFTS), 3)
+        result["similarity"] = round(sum(similarity(a, b) for a, b in zip(reference, revisions)) / len(DRAFTS), 3)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compares /api/revise throughput and latency with and without micro-batching.
+
+Usage: python benchmarks/bench_revise_batching.py <adapter_path> [--requests 32] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import revise_response
+from revise_batcher import RevisionBatcher
+
+DRAFTS = json.loads((Path(__file__).parent / "drafts.json").read_text(encoding="utf-8"))
+
+
+async def run_load(model, tokenizer, adapter_name: str, requests: int, concurrency: int,
+                   window_ms: float, max_batch_size: int) -> dict:
+    async def run_batch(key, items):
+        # Generate off the event loop so the batcher keeps collecting requests
+        return await asyncio.to_thread(
+            revise_response.rewrite_drafts, items, model, tokenizer, adapter_name=key
+        )
+
+    batcher = RevisionBatcher(run_batch, window_ms=window_ms, max_batch_size=max_batch_size)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await batcher.submit(adapter_name, DRAFTS[i % len(DRAFTS)])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    stats = batcher.stats()
+    stats["elapsed_s"] = round(elapsed, 3)
+    stats["throughput_rps"] = round(requests / elapsed, 3)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("adapter_path")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--window-ms", type=float, default=20)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    adapter_name = Path(args.adapter_path).name
+    model, tokenizer = revise_response.load_adapter(adapter_name, args.adapter_path)
+    # Warm-up so the first measured request doesn't pay one-time costs
+    revise_response.rewrite_draft(DRAFTS[0], model, tokenizer, adapter_name=adapter_name)
+
+    results = {
+        "unbatched": asyncio.run(run_load(
+            model, tokenizer, adapter_name, args.requests, args.concurrency, 0, 1
+        )),
+        "batched": asyncio.run(run_load(
+            model, tokenizer, adapter_name, args.requests, args.concurrency, args.window_ms, args.max_batch_size
+        )),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
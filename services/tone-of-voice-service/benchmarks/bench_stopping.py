@@ -0,0 +1,72 @@
+"""
+Measures how many generated tokens the early stopping criteria save on the
+fixed draft corpus, and checks that the cleaned revisions are unchanged.
+
+Usage: python benchmarks/bench_stopping.py <adapter_path> [--batch-size 4] [--seed 0]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import torch
+
+import revise_response
+
+DRAFTS = json.loads((Path(__file__).parent / "drafts.json").read_text(encoding="utf-8"))
+
+
+def run_corpus(model, tokenizer, adapter_name: str, batch_size: int, seed: int, stop_early: bool) -> dict:
+    revisions = []
+    generated_tokens = 0
+    start = time.perf_counter()
+    for batch_index, offset in enumerate(range(0, len(DRAFTS), batch_size)):
+        # Same seed per batch in both modes, so sampling matches up to the stop point
+        torch.manual_seed(seed + batch_index)
+        prompts = [revise_response.build_prompt(draft) for draft in DRAFTS[offset:offset + batch_size]]
+        outputs, prompt_length = revise_response.generate_revisions(
+            prompts, model, tokenizer, adapter_name=adapter_name, stop_early=stop_early
+        )
+        generated_tokens += int((outputs[:, prompt_length:] != tokenizer.eos_token_id).sum())
+        revisions.extend(
+            revise_response.clean_revision(tokenizer.decode(output, skip_special_tokens=True), prompt)
+            for output, prompt in zip(outputs, prompts)
+        )
+    elapsed = time.perf_counter() - start
+    return {
+        "generated_tokens": generated_tokens,
+        "elapsed_s": round(elapsed, 3),
+        "revisions": revisions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("adapter_path")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    adapter_name = Path(args.adapter_path).name
+    model, tokenizer = revise_response.load_adapter(adapter_name, args.adapter_path)
+
+    baseline = run_corpus(model, tokenizer, adapter_name, args.batch_size, args.seed, stop_early=False)
+    stopped = run_corpus(model, tokenizer, adapter_name, args.batch_size, args.seed, stop_early=True)
+
+    matching = sum(a == b for a, b in zip(baseline.pop("revisions"), stopped.pop("revisions")))
+    saved = baseline["generated_tokens"] - stopped["generated_tokens"]
+    print(json.dumps({
+        "drafts": len(DRAFTS),
+        "without_stopping": baseline,
+        "with_stopping": stopped,
+        "tokens_saved": saved,
+        "tokens_saved_pct": round(100 * saved / baseline["generated_tokens"], 1) if baseline["generated_tokens"] else 0.0,
+        "identical_revisions": matching,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
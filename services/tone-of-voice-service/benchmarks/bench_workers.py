@@ -0,0 +1,182 @@
+"""
+Benchmarks multi-process serving: starts the service with
+INFERENCE_PROCESSES=1, 2 and 4 (BASE_WEIGHTS_MMAP=1) against several
+accounts, fires concurrent /api/revise requests and reports throughput,
+latency and the memory of the whole process tree. RSS counts shared pages
+in every process that maps them; PSS splits them between those processes,
+so its sum is the real footprint.
+
+Uses a random offline model of the tiny model's shape, --hidden-size wide
+and --layers deep, saved in bf16 like the Mistral snapshot; a tiny one is
+dwarfed by the few hundred MB torch runtime of each process, so make it
+big enough to see the weights shared. Pass
+--base-model with a local safetensors snapshot to measure a real model.
+--processes 0 measures the default in-process serving and --no-mmap loaded
+copies of the weights for comparison.
+
+Usage: python benchmarks/bench_workers.py [--processes 1,2,4] [--accounts 8] [--requests 64]
+                                          [--concurrency 8] [--hidden-size 1024] [--layers 8]
+                                          [--base-model DIR] [--no-mmap]
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+import torch
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from tiny_model import DRAFTS, create_tiny_adapter, create_tiny_model
+from revise_batcher import percentile
+
+
+def process_tree(pid: int) -> list:
+    """pid and all its descendants"""
+    pids = [pid]
+    for child in pids:
+        for task in Path(f"/proc/{child}/task").glob("*"):
+            children = (task / "children").read_text().split()
+            pids.extend(int(c) for c in children if int(c) not in pids)
+    return pids
+
+
+def memory_mb(pid: int) -> dict:
+    """Summed RSS and PSS of a process tree, from /proc/<pid>/smaps_rollup"""
+    totals = {"processes": 0, "rss_mb": 0.0, "pss_mb": 0.0}
+    for member in process_tree(pid):
+        try:
+            rollup = Path(f"/proc/{member}/smaps_rollup").read_text()
+        except OSError:
+            continue
+        totals["processes"] += 1
+        for line in rollup.splitlines():
+            field, _, value = line.partition(":")
+            if field in ("Rss", "Pss"):
+                totals[f"{field.lower()}_mb"] += int(value.split()[0]) / 1024
+    return {key: round(value, 1) for key, value in totals.items()}
+
+
+def wait_for_warm_up(client: httpx.Client, timeout: float = 300):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            warmup = client.get("/api/status").json()["warmup"]
+            if warmup["state"] == "ready":
+                return
+            if warmup["state"] == "failed":
+                raise RuntimeError(f"Warm-up failed: {warmup.get('error')}")
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError("Service did not finish warming up")
+
+
+def run_server(workdir: Path, base_model: str, processes: int, accounts: list,
+               requests: int, concurrency: int, mmap: bool) -> dict:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(SERVICE_DIR),
+        "BASE_MODEL": base_model,
+        "BASE_WEIGHTS_MMAP": "1" if mmap else "0",
+        "INFERENCE_PROCESSES": str(processes),
+        "INFERENCE_MAX_PENDING": str(max(32, concurrency)),
+        "PRELOAD_ACCOUNTS": ",".join(accounts),
+        "ADAPTER_CACHE_MAX_ENTRIES": str(max(8, len(accounts))),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=300) as client:
+            wait_for_warm_up(client)
+            idle = memory_mb(server.pid)
+
+            def revise(i: int) -> float:
+                user_id, account_id = accounts[i % len(accounts)].split("_", 1)
+                start = time.perf_counter()
+                response = client.post("/api/revise", json={
+                    "draft_text": DRAFTS[i % len(DRAFTS)], "userId": user_id, "accountId": account_id,
+                })
+                assert response.json()["model_used"] == "mistral-fine-tuned", response.text
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                latencies = list(pool.map(revise, range(requests)))
+            elapsed = time.perf_counter() - start
+            loaded = memory_mb(server.pid)
+            workers = client.get("/api/status").json()["inference_workers"]
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "throughput_rps": round(requests / elapsed, 3),
+        "latency_p50_s": round(percentile(latencies, 50), 4),
+        "latency_p99_s": round(percentile(latencies, 99), 4),
+        "memory_idle": idle,
+        "memory_after_load": loaded,
+        "requests_per_worker": workers["requests"] if workers else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", default="1,2,4")
+    parser.add_argument("--accounts", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--hidden-size", type=int, default=1024)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--base-model", help="Local model snapshot with safetensors weights")
+    parser.add_argument("--no-mmap", action="store_true")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="tone-of-voice-workers-"))
+    try:
+        base_model = args.base_model or str(
+            create_tiny_model(
+                workdir / "base", hidden_size=args.hidden_size, num_hidden_layers=args.layers, dtype=torch.bfloat16
+            )
+        )
+        accounts = [f"bench_user_account{i}" for i in range(args.accounts)]
+        for i, key in enumerate(accounts):
+            create_tiny_adapter(base_model, workdir / "outputs/tone_of_voice_lora" / key, seed=i)
+
+        weights_mb = sum(path.stat().st_size for path in Path(base_model).glob("*.safetensors")) / 2**20
+        results = {
+            "base_weights_mb": round(weights_mb, 1),
+            "base_weights_mmap": not args.no_mmap,
+            "accounts": args.accounts,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        }
+        for processes in [int(n) for n in args.processes.split(",") if n]:
+            print(f"Benchmarking {processes} inference worker(s)...", file=sys.stderr)
+            results[f"workers_{processes}"] = run_server(
+                workdir, base_model, processes, accounts, args.requests, args.concurrency, not args.no_mmap
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
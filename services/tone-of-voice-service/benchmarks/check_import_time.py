@@ -0,0 +1,103 @@
+"""
+Checks that the API process starts fast: imports main under `python -X
+importtime` in a fresh interpreter, reports the cumulative import time and
+the slowest modules, and fails if it exceeds the budget or pulls in the ML
+stack, which must only be imported on first inference or training use.
+With --serve it also starts uvicorn and measures the time until
+/api/health answers.
+
+Usage: python benchmarks/check_import_time.py [--budget-ms 1500] [--top 10] [--serve]
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+
+# Must not be imported by `import main`
+HEAVY_MODULES = ("torch", "transformers", "peft", "datasets", "accelerate", "bitsandbytes")
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times() -> list:
+    """(module, self_us, cumulative_us, depth) for every module imported by `import main`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=SERVICE_DIR,
+        env={**os.environ, "PYTHONPATH": str(SERVICE_DIR)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            modules.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return modules
+
+
+def time_to_health(timeout: float = 60) -> float:
+    """Seconds from starting uvicorn until /api/health answers"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIR,
+        env={**os.environ, "PYTHONPATH": str(SERVICE_DIR)},
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError("/api/health did not answer")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--serve", action="store_true")
+    args = parser.parse_args()
+
+    modules = import_times()
+    total_ms = next(cumulative for module, _, cumulative, depth in modules if module == "main" and depth == 0) / 1000
+    # Direct imports of main; modules at depth 0 besides main are interpreter startup
+    top_level = sorted((m for m in modules if m[3] == 1), key=lambda m: m[2], reverse=True)
+    heavy = sorted({module.split(".")[0] for module, *_ in modules} & set(HEAVY_MODULES))
+    report = {
+        "import_main_ms": round(total_ms, 1),
+        "budget_ms": args.budget_ms,
+        "slowest_imports_ms": {module: round(cumulative / 1000, 1) for module, _, cumulative, _ in top_level[:args.top]},
+        "heavy_modules_imported": heavy,
+    }
+    if args.serve:
+        report["time_to_health_ms"] = round(time_to_health() * 1000, 1)
+    print(json.dumps(report, indent=2))
+
+    if heavy:
+        sys.exit(f"`import main` imports {', '.join(heavy)}; import them lazily instead")
+    if total_ms > args.budget_ms:
+        sys.exit(f"`import main` took {total_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+
+
+if __name__ == "__main__":
+    main()
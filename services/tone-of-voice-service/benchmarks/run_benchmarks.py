@@ -0,0 +1,356 @@
+"""
+Offline benchmark suite for the tone-of-voice service.
+
+Runs the real service code against a tiny randomly-initialized model with
+LoRA adapters (see tiny_model.py), so it needs no network access, and
+writes all results to one JSON file that can be compared between commits.
+
+Usage: python benchmarks/run_benchmarks.py [--output results.json] [--compare previous.json]
+                                           [--pair-sizes 10000,100000,1000000]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from tiny_model import DRAFTS, create_tiny_adapter, create_tiny_model
+from revise_batcher import percentile
+
+BENCH_USER = "bench_user"
+BENCH_ACCOUNT = "bench_account"
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def latency_summary(latencies: list) -> dict:
+    return {
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 3),
+        "p50_ms": round(1000 * percentile(latencies, 50), 3),
+        "p99_ms": round(1000 * percentile(latencies, 99), 3),
+    }
+
+
+def write_synthetic_pairs(path: Path, lines: int, accounts: int):
+    with path.open("w", encoding="utf-8") as f:
+        for i in range(lines):
+            f.write(json.dumps({
+                # Numbered, as the pair store drops an account's duplicate pairs
+                "draft": f"{DRAFTS[i % len(DRAFTS)]} ({i})",
+                "final": DRAFTS[(i + 1) % len(DRAFTS)],
+                "userId": f"user{i % accounts}",
+                "accountId": "account",
+                "timestamp": "2025-01-01T00:00:00",
+            }, ensure_ascii=False) + "\n")
+
+
+def scan_count(path: Path, user_id: str, account_id: str) -> int:
+    """The full-file scan count_pairs_for_user used before the pair store"""
+    count = 0
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("userId") == user_id and record.get("accountId") == account_id:
+                count += 1
+    return count
+
+
+def bench_pair_store(workdir: Path, sizes: list, accounts: int = 1000) -> dict:
+    from pair_store import PairStore
+
+    results = {}
+    for size in sizes:
+        directory = workdir / f"pairs-{size}"
+        directory.mkdir()
+        jsonl_path = directory / "pairs.jsonl"
+        write_synthetic_pairs(jsonl_path, size, accounts)
+        _, scan_s = timed(scan_count, jsonl_path, "user0", "account")
+
+        store, migrate_s = timed(PairStore, directory / "pairs.db", jsonl_path)
+        count_latencies = []
+        for _ in range(1000):
+            user_id = f"user{random.randrange(accounts)}"
+            _, elapsed = timed(store.count_pairs_for_user, user_id, "account")
+            count_latencies.append(elapsed)
+        pairs, get_pairs_s = timed(store.get_pairs, "user0", "account")
+        add_latencies = [
+            timed(store.add_pair, "user0", "account", f"{DRAFTS[0]} (new {i})", DRAFTS[1])[1] for i in range(200)
+        ]
+        store.close()
+        shutil.rmtree(directory)
+
+        results[str(size)] = {
+            "jsonl_scan_count_s": round(scan_s, 4),
+            "migrate_s": round(migrate_s, 3),
+            "count_pairs_for_user": latency_summary(count_latencies),
+            "get_pairs_s": round(get_pairs_s, 4),
+            "get_pairs_rows": len(pairs),
+            "add_pair": latency_summary(add_latencies),
+        }
+    return results
+
+
+def bench_adapter_load(base_dir: Path, workdir: Path, adapters: int = 3) -> dict:
+    import revise_response
+
+    _, base_load_s = timed(revise_response.load_base_model)
+    load_times = []
+    nbytes = 0
+    for i in range(adapters):
+        adapter_dir = create_tiny_adapter(base_dir, workdir / f"adapter-load-{i}", seed=i)
+        (model, _), elapsed = timed(revise_response.load_adapter, f"load_{i}", str(adapter_dir))
+        load_times.append(elapsed)
+        nbytes = revise_response.adapter_nbytes(model, f"load_{i}")
+        revise_response.unload_adapter(f"load_{i}")
+    return {
+        "base_load_s": round(base_load_s, 3),
+        "adapter_load": latency_summary(load_times),
+        "adapter_mb": round(nbytes / 2**20, 3),
+    }
+
+
+def bench_revise(requests: int, concurrency: int) -> dict:
+    from fastapi.testclient import TestClient
+
+    import main
+
+    payloads = [
+        {"draft_text": DRAFTS[i % len(DRAFTS)], "userId": BENCH_USER, "accountId": BENCH_ACCOUNT}
+        for i in range(requests)
+    ]
+    with TestClient(main.app) as client:
+        # First request pays the adapter load; measured separately
+        _, cold_s = timed(client.post, "/api/revise", json=payloads[0])
+
+        def revise(payload):
+            response, elapsed = timed(client.post, "/api/revise", json=payload)
+            assert response.json()["model_used"] == "mistral-fine-tuned", response.text
+            return elapsed
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(revise, payloads))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "cold_request_s": round(cold_s, 3),
+        "throughput_rps": round(requests / elapsed, 3),
+        "latency": latency_summary(latencies),
+    }
+
+
+def bench_batching(requests: int, concurrency: int) -> dict:
+    import asyncio
+
+    import revise_response
+    from bench_revise_batching import run_load
+
+    adapter_name = f"{BENCH_USER}_{BENCH_ACCOUNT}"
+    adapter_dir = Path("outputs/tone_of_voice_lora") / adapter_name
+    model, tokenizer = revise_response.load_adapter(adapter_name, str(adapter_dir))
+    return {
+        "unbatched": asyncio.run(run_load(model, tokenizer, adapter_name, requests, concurrency, 0, 1)),
+        "batched": asyncio.run(run_load(model, tokenizer, adapter_name, requests, concurrency, 20, concurrency)),
+    }
+
+
+def bench_stopping() -> dict:
+    import revise_response
+    from bench_stopping import run_corpus
+
+    adapter_name = f"{BENCH_USER}_{BENCH_ACCOUNT}"
+    adapter_dir = Path("outputs/tone_of_voice_lora") / adapter_name
+    model, tokenizer = revise_response.load_adapter(adapter_name, str(adapter_dir))
+    baseline = run_corpus(model, tokenizer, adapter_name, 4, 0, stop_early=False)
+    stopped = run_corpus(model, tokenizer, adapter_name, 4, 0, stop_early=True)
+    return {
+        "without_stopping_tokens": baseline["generated_tokens"],
+        "with_stopping_tokens": stopped["generated_tokens"],
+        "without_stopping_s": baseline["elapsed_s"],
+        "with_stopping_s": stopped["elapsed_s"],
+    }
+
+
+def bench_assisted() -> dict:
+    import revise_response
+    from bench_assisted import run_corpus
+
+    adapter_name = f"{BENCH_USER}_{BENCH_ACCOUNT}"
+    adapter_dir = Path("outputs/tone_of_voice_lora") / adapter_name
+    model, tokenizer = revise_response.load_adapter(adapter_name, str(adapter_dir))
+    settings = revise_response.GENERATION_SETTINGS
+    revise_response.GENERATION_SETTINGS = {**settings, "do_sample": False}
+    try:
+        plain = run_corpus(model, tokenizer, adapter_name, "off", 0)
+        assisted = run_corpus(model, tokenizer, adapter_name, "prompt-lookup", 0)
+    finally:
+        revise_response.GENERATION_SETTINGS = settings
+        revise_response.ASSISTED_DECODING = "off"
+    return {
+        "plain_tokens_per_second": plain["tokens_per_second"],
+        "prompt_lookup_tokens_per_second": assisted["tokens_per_second"],
+        "acceptance_rate": assisted["acceptance_rate"],
+        "identical_revisions": sum(a == b for a, b in zip(plain["revisions"], assisted["revisions"])),
+    }
+
+
+def bench_training(pairs: int) -> dict:
+    from pair_store import PairStore
+    from train_tone_of_voice import train_model
+
+    results = {}
+    store = PairStore()
+    for batching in ("single", "grouped", "packed"):
+        # A fresh account per mode, so every run is a full training
+        for i in range(pairs):
+            store.add_pair("train_user", batching, f"{DRAFTS[i % len(DRAFTS)]} ({i})", DRAFTS[(i + 3) % len(DRAFTS)])
+        metrics, elapsed = timed(train_model, "train_user", batching, batching=batching)
+        metrics["total_s"] = round(elapsed, 3)
+        results[batching] = metrics
+    store.close()
+    return results
+
+
+def bench_tokenization(examples: int) -> dict:
+    from datasets import Dataset, DatasetDict
+    from transformers import AutoTokenizer
+
+    from prompts import build_prompt
+    from train_tone_of_voice import BASE_MODEL_NAME, tokenize_dataset
+
+    tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL_NAME)
+
+    def dataset(start: int, count: int):
+        texts = [
+            build_prompt(f"{DRAFTS[i % len(DRAFTS)]} ({i})") + DRAFTS[(i + 1) % len(DRAFTS)]
+            for i in range(start, start + count)
+        ]
+        return DatasetDict({"train": Dataset.from_dict({"text": texts})})
+
+    history = dataset(0, examples)
+    _, cold_s = timed(tokenize_dataset, history, tokenizer, "bench_tokenization")
+    _, warm_s = timed(tokenize_dataset, history, tokenizer, "bench_tokenization")
+    # A retrain after 1% new pairs
+    grown = dataset(0, examples + examples // 100)
+    _, incremental_s = timed(tokenize_dataset, grown, tokenizer, "bench_tokenization")
+    return {
+        "examples": examples,
+        "cold_s": round(cold_s, 3),
+        "cached_s": round(warm_s, 3),
+        "one_percent_new_s": round(incremental_s, 3),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=SERVICE_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(previous: dict, current: dict):
+    """Prints every numeric result next to its value in a previous run"""
+    before, after = flatten(previous), flatten(current)
+    for name in sorted(after):
+        if name.startswith("meta.") or name not in before:
+            continue
+        old, new = before[name], after[name]
+        change = f"{100 * (new - old) / old:+.1f}%" if old else "n/a"
+        print(f"{name:70s} {old:>14.4f} -> {new:>14.4f}  {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--pair-sizes", default="10000,100000,1000000",
+                        help="Comma-separated synthetic pairs.jsonl sizes (up to 10000000)")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--training-pairs", type=int, default=40)
+    parser.add_argument("--tokenize-examples", type=int, default=20000)
+    args = parser.parse_args()
+
+    output_path = Path(args.output).resolve()
+    compare_path = Path(args.compare).resolve() if args.compare else None
+    workdir = Path(tempfile.mkdtemp(prefix="tone-of-voice-bench-"))
+    base_dir = create_tiny_model(workdir / "tiny-base")
+    create_tiny_adapter(base_dir, workdir / "outputs/tone_of_voice_lora" / f"{BENCH_USER}_{BENCH_ACCOUNT}")
+
+    # Service modules read BASE_MODEL and use relative data/ and outputs/ paths
+    os.environ["BASE_MODEL"] = str(base_dir)
+    os.chdir(workdir)
+
+    import torch
+    import transformers
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "cpu_count": os.cpu_count(),
+        }
+    }
+    try:
+        sizes = [int(size) for size in args.pair_sizes.split(",") if size]
+        print(f"Benchmarking pair store ({sizes})...")
+        results["pair_store"] = bench_pair_store(workdir, sizes)
+        print("Benchmarking adapter load...")
+        results["adapter_load"] = bench_adapter_load(base_dir, workdir)
+        print("Benchmarking /api/revise...")
+        results["revise"] = bench_revise(args.requests, args.concurrency)
+        print("Benchmarking revise batching...")
+        results["revise_batching"] = bench_batching(args.requests, args.concurrency)
+        print("Benchmarking early stopping...")
+        results["stopping"] = bench_stopping()
+        print("Benchmarking assisted decoding...")
+        results["assisted_decoding"] = bench_assisted()
+        print("Benchmarking training tokenization...")
+        results["tokenization"] = bench_tokenization(args.tokenize_examples)
+        print("Benchmarking training...")
+        results["training"] = bench_training(args.training_pairs)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output_path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"Results written to {output_path}")
+    if compare_path:
+        compare(json.loads(compare_path.read_text(encoding="utf-8")), results)
+
+
+if __name__ == "__main__":
+    main()
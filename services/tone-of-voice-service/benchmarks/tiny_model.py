@@ -0,0 +1,94 @@
+"""
+Builds a tiny randomly-initialized Mistral-architecture model, a tokenizer
+and LoRA adapters entirely offline, so the service code paths can be
+benchmarked without downloading the real base model.
+
+Usage: python benchmarks/tiny_model.py <output_dir>
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import torch
+from peft import LoraConfig, get_peft_model
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, processors, trainers
+from transformers import MistralConfig, MistralForCausalLM, PreTrainedTokenizerFast
+
+from prompts import build_prompt
+
+DRAFTS = json.loads((Path(__file__).parent / "drafts.json").read_text(encoding="utf-8"))
+
+VOCAB_SIZE = 1024
+
+
+def build_tokenizer() -> PreTrainedTokenizerFast:
+    """Byte-level BPE trained on the prompt and the draft corpus"""
+    tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=VOCAB_SIZE,
+        special_tokens=["<unk>", "<s>", "</s>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    tokenizer.train_from_iterator([build_prompt(draft) for draft in DRAFTS] * 4, trainer)
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<s> $A", special_tokens=[("<s>", tokenizer.token_to_id("<s>"))]
+    )
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        bos_token="<s>",
+        eos_token="</s>",
+        unk_token="<unk>",
+        model_input_names=["input_ids", "attention_mask"],
+    )
+
+
+def create_tiny_model(output_dir: Path, seed: int = 0, hidden_size: int = 64, num_hidden_layers: int = 2,
+                      dtype: torch.dtype = torch.float32) -> Path:
+    """Saves a tiny base model (or a bigger one of the same shape) and tokenizer to output_dir and returns it"""
+    output_dir = Path(output_dir)
+    tokenizer = build_tokenizer()
+    torch.manual_seed(seed)
+    config = MistralConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=2 * hidden_size,
+        num_hidden_layers=num_hidden_layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=2048,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    )
+    MistralForCausalLM(config).to(dtype).save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    return output_dir
+
+
+def create_tiny_adapter(base_dir: Path, adapter_dir: Path, seed: int = 0) -> Path:
+    """Saves a randomly-initialized LoRA adapter for the tiny base model"""
+    torch.manual_seed(seed)
+    lora_config = LoraConfig(
+        r=8,
+        lora_alpha=16,
+        target_modules=["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"],
+        bias="none",
+        task_type="CAUSAL_LM",
+        init_lora_weights=False,  # Non-zero weights so adapters actually differ
+    )
+    model = get_peft_model(MistralForCausalLM.from_pretrained(base_dir), lora_config)
+    model.save_pretrained(adapter_dir)
+    PreTrainedTokenizerFast.from_pretrained(base_dir).save_pretrained(adapter_dir)
+    return Path(adapter_dir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python benchmarks/tiny_model.py <output_dir>")
+        sys.exit(1)
+    base_dir = create_tiny_model(Path(sys.argv[1]) / "base")
+    create_tiny_adapter(base_dir, Path(sys.argv[1]) / "adapter")
+    print(f"Tiny model written to {sys.argv[1]}")
@@ -0,0 +1,36 @@
+import json
+import os
+
+from prompts import PROMPT_PREFIX
+
+# Inference settings, kept apart from revise_response so the API can read
+# them without importing torch, transformers and peft
+
+BASE_MODEL_NAME = os.getenv("BASE_MODEL", "mistralai/Mistral-7B-Instruct-v0.2")
+
+# Weight precision for inference:
+#   auto        - fp16 on GPU, fp32 on CPU
+#   bf16        - bfloat16 (also on CPU)
+#   int8        - shared base model in int8 (bitsandbytes on GPU, dynamic quantization on CPU), adapters in fp32
+#   int8-merged - per-account model with the adapter merged into int8 weights (CPU), exported by the training job
+INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", "auto")
+
+# Sampling settings shared by every generation path
+GENERATION_SETTINGS = dict(
+    max_new_tokens=300,
+    min_length=30,
+    do_sample=True,
+    temperature=0.3,  # Low temperature for consistency
+    top_p=0.75,
+    top_k=25,
+    repetition_penalty=1.35,  # Higher to prevent repetition
+    no_repeat_ngram_size=3,
+)
+
+
+def generation_fingerprint() -> str:
+    """Everything apart from the adapter and the draft that determines a revision, as a cache key part"""
+    return json.dumps(
+        {"base_model": BASE_MODEL_NAME, "precision": INFERENCE_PRECISION, "prompt": PROMPT_PREFIX, **GENERATION_SETTINGS},
+        sort_keys=True,
+    )
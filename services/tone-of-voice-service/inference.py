@@ -0,0 +1,49 @@
+"""
+Entry points into revise_response for the API process.
+
+revise_response pulls in torch, transformers and peft, which take seconds to
+import. These wrappers import it on first call instead, which happens on the
+inference pool (warm-up or the first revision), so the API binds its port
+and answers light endpoints right away.
+"""
+
+
+def load_base_model():
+    from revise_response import load_base_model
+    return load_base_model()
+
+
+def load_adapter(adapter_name: str, adapter_path: str):
+    from revise_response import load_adapter
+    return load_adapter(adapter_name, adapter_path)
+
+
+def schedule_unload(adapter_name: str):
+    # Only called for adapters that were loaded, so this import is already done
+    from revise_response import schedule_unload
+    return schedule_unload(adapter_name)
+
+
+def unload_pending():
+    from revise_response import unload_pending
+    return unload_pending()
+
+
+def merged_model_nbytes() -> int:
+    from revise_response import merged_model_nbytes
+    return merged_model_nbytes()
+
+
+def adapter_nbytes(model, adapter_name: str) -> int:
+    from revise_response import adapter_nbytes
+    return adapter_nbytes(model, adapter_name)
+
+
+def rewrite_drafts(draft_texts: list, model, tokenizer, adapter_name: str = None) -> list:
+    from revise_response import rewrite_drafts
+    return rewrite_drafts(draft_texts, model, tokenizer, adapter_name=adapter_name)
+
+
+def stream_draft(draft_text: str, model, tokenizer, on_text, adapter_name: str = None, stop_event=None) -> str:
+    from revise_response import stream_draft
+    return stream_draft(draft_text, model, tokenizer, on_text, adapter_name=adapter_name, stop_event=stop_event)
@@ -0,0 +1,59 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Background inference task failed: {future.exception()}")
+
+
+class InferenceExecutor:
+    """
+    Dedicated thread pool for model loading and generation.
+
+    Keeps the blocking torch work off the asyncio event loop so light
+    endpoints stay responsive. Requests reserve a slot with try_acquire()
+    before doing any inference; once max_pending requests are in flight
+    (running or waiting), further requests are turned away immediately.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        # Only touched from the event loop thread, so no lock is needed
+        self.pending = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        self.pending += 1
+        return True
+
+    def release(self):
+        self.pending = max(0, self.pending - 1)
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the inference pool and awaits its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs) on the inference pool without waiting for it; failures are logged"""
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(_log_failure)
+        return future
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import itertools
+import multiprocessing
+import os
+import threading
+from multiprocessing.connection import wait
+from contextlib import aclosing
+
+
+class _CancelFlag:
+    """threading.Event stand-in for stream_draft: set once the router cancels this request"""
+
+    def __init__(self, cancelled, request_id: int):
+        self.cancelled = cancelled
+        self.request_id = request_id
+
+    def is_set(self) -> bool:
+        return self.cancelled.value == self.request_id
+
+
+def run_inference_worker(index: int, requests, results, cancelled, options: dict):
+    """
+    Inference worker process entry point. Holds its own view of the base
+    model and its own adapter cache, and serves requests one at a time:
+    (request_id, op, payload) with op "load", "revise", "stream" or
+    "merged_nbytes" (the size of one merged int8 model, for the budget check).
+    Results go back over this worker's own pipe, so a worker that dies
+    mid-write can't block the others.
+    """
+    # Imported here so only the worker processes pay for the ML stack
+    import torch
+    import revise_response
+    from adapter_cache import AdapterCache
+    from adapter_store import account_dir, current_adapter
+
+    torch.set_num_threads(options["threads"])
+    cache = AdapterCache(
+        max_entries=options["max_entries"],
+        max_bytes=options["max_bytes"],
+        pinned=options["pinned"],
+        on_evict=lambda key, entry: revise_response.unload_adapter(entry["adapter_name"]),
+    )
+
+    def acquire_adapter(key: str) -> dict:
+        """
+        The account's published adapter version, acquired for use (release it
+        with cache.release()) and loaded if not resident yet
+        """
+        version, adapter_path = current_adapter(account_dir(key))
+        if version is None:
+            raise FileNotFoundError(f"No adapter for {key}")
+        entry = cache.acquire(key)
+        if entry is None or entry["version"] != version:
+            if entry is not None:
+                cache.release(key, entry)
+            adapter_name = f"{key}@{version}"
+            print(f"Worker {index}: loading adapter {adapter_name}")
+            model, tokenizer = revise_response.load_adapter(adapter_name, str(adapter_path))
+            nbytes = revise_response.adapter_nbytes(model, adapter_name)
+            entry = cache.replace(key, model, tokenizer, nbytes, in_use=True, version=version, adapter_name=adapter_name)
+        return entry
+
+    if options["warm_up"]:
+        revise_response.load_base_model()
+    results.send((index, None, "ready", os.getpid()))
+
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        request_id, op, payload = message
+        try:
+            if op == "merged_nbytes":
+                results.send((index, request_id, "done", {
+                    "nbytes": revise_response.merged_model_nbytes(),
+                    "resident": [item["key"] for item in cache.resident()],
+                }))
+                continue
+            entry = acquire_adapter(payload["key"])
+            try:
+                model, tokenizer, adapter_name = entry["model"], entry["tokenizer"], entry["adapter_name"]
+                if op == "revise":
+                    revised = revise_response.rewrite_drafts(
+                        payload["drafts"], model, tokenizer, adapter_name=adapter_name
+                    )
+                elif op == "stream":
+                    revised = revise_response.stream_draft(
+                        payload["draft"], model, tokenizer,
+                        on_text=lambda text: results.send((index, request_id, "token", text)),
+                        adapter_name=adapter_name,
+                        stop_event=_CancelFlag(cancelled, request_id),
+                    )
+                else:
+                    revised = None
+            finally:
+                cache.release(payload["key"], entry)
+            results.send((index, request_id, "done", {
+                "revised": revised,
+                "version": entry["version"],
+                "resident": [item["key"] for item in cache.resident()],
+            }))
+        except Exception as e:
+            results.send((index, request_id, "error", str(e)))
+
+
+class InferenceWorkerPool:
+    """
+    Serves inference from worker processes, routing every account to the
+    same worker (by a stable hash of its key) so each adapter is resident in
+    exactly one of them. Workers run requests one at a time. The results
+    reader notices a worker exiting (its pipe closes), fails the requests
+    it had and restarts it.
+    """
+
+    def __init__(self, num_workers: int, options: dict):
+        self.num_workers = num_workers
+        self.options = options
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = [None] * num_workers  # (process, requests, cancelled, results)
+        self._waiting = {}  # {request_id: (worker index, asyncio.Queue)}
+        self._request_ids = itertools.count(1)
+        self._loop = None
+        self._reader = None
+        self._stopped = False
+        self.ready = [False] * num_workers
+        self.resident = [[] for _ in range(num_workers)]
+        self.requests = [0] * num_workers
+        self.restarts = 0
+
+    def start(self, loop):
+        self._loop = loop
+        for index in range(self.num_workers):
+            self._start_worker(index)
+        self._reader = threading.Thread(target=self._read_results, name="inference-results", daemon=True)
+        self._reader.start()
+
+    def _start_worker(self, index: int):
+        requests = self._context.Queue()
+        cancelled = self._context.Value("q", 0)
+        results, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=run_inference_worker,
+            args=(index, requests, sender, cancelled, self.options),
+            name=f"inference-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        # Only the worker holds the sending end, so reading fails once it exits
+        sender.close()
+        self._workers[index] = (process, requests, cancelled, results)
+        self.ready[index] = False
+        print(f"Started inference worker {index} (pid {process.pid})")
+
+    def stop(self):
+        # First, so the reader doesn't restart the workers exiting below
+        self._stopped = True
+        self._reader.join(timeout=10)
+        for process, requests, _, _ in self._workers:
+            requests.put(None)
+        for process, _, _, _ in self._workers:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+    def _read_results(self):
+        while not self._stopped:
+            # Re-read the pipes every round to pick up restarted workers
+            pipes = {worker[3]: index for index, worker in enumerate(self._workers)}
+            for results in wait(list(pipes), timeout=0.5):
+                try:
+                    self._dispatch(*results.recv())
+                except (EOFError, OSError):
+                    # Only the worker holds the sending end: it exited
+                    results.close()
+                    if not self._stopped:
+                        self._restart_worker(pipes[results])
+
+    def _restart_worker(self, index: int):
+        """Fails the requests of a worker that exited and starts a new one"""
+        process = self._workers[index][0]
+        process.join(timeout=5)
+        print(f"Inference worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+        self.restarts += 1
+        self.resident[index] = []
+        self._start_worker(index)
+        for request_id, (worker, events) in list(self._waiting.items()):
+            if worker == index:
+                self._loop.call_soon_threadsafe(
+                    events.put_nowait, ("error", f"Inference worker {index} exited")
+                )
+
+    def _dispatch(self, index: int, request_id: int, kind: str, payload):
+        if kind == "ready":
+            self.ready[index] = True
+            return
+        if kind == "done":
+            self.resident[index] = payload["resident"]
+        waiting = self._waiting.get(request_id)
+        if waiting is not None:
+            self._loop.call_soon_threadsafe(waiting[1].put_nowait, (kind, payload))
+
+    def worker_for(self, key: str) -> int:
+        # Not crc32: its low bits barely change between keys like "u_account1" and "u_account2"
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.num_workers
+
+    def is_resident(self, key: str) -> bool:
+        return key in self.resident[self.worker_for(key)]
+
+    async def _events(self, key: str, op: str, payload: dict):
+        """
+        Sends one request to the account's worker and yields its ("token",
+        text) and finally ("done", result) events; raises RuntimeError if the
+        request failed. Closing the generator early cancels a stream.
+        """
+        index = self.worker_for(key)
+        request_id = next(self._request_ids)
+        events = asyncio.Queue()
+        # Registered before sending, so a worker exiting from here on fails this request
+        self._waiting[request_id] = (index, events)
+        self.requests[index] += 1
+        _, requests, cancelled, _ = self._workers[index]
+        requests.put((request_id, op, {"key": key, **payload}))
+        finished = False
+        try:
+            while True:
+                kind, data = await events.get()
+                if kind in ("done", "error"):
+                    finished = True
+                if kind == "error":
+                    raise RuntimeError(data)
+                yield kind, data
+                if kind == "done":
+                    return
+        finally:
+            self._waiting.pop(request_id, None)
+            if not finished:
+                # Tell the worker to stop generating, the caller went away
+                cancelled.value = request_id
+
+    async def call(self, key: str, op: str, **payload) -> dict:
+        """Runs a "load", "revise" or "merged_nbytes" request and returns the worker's result"""
+        async with aclosing(self._events(key, op, payload)) as events:
+            async for kind, data in events:
+                if kind == "done":
+                    return data
+
+    def stream(self, key: str, draft: str):
+        """Async generator of a "stream" request's events; see _events()"""
+        return self._events(key, "stream", {"draft": draft})
+
+    async def wait_ready(self):
+        while not all(self.ready):
+            await asyncio.sleep(0.1)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.num_workers,
+            "pids": [worker[0].pid if worker else None for worker in self._workers],
+            "ready": self.ready,
+            "requests": self.requests,
+            "restarts": self.restarts,
+            "resident_adapters": self.resident,
+        }
@@ -1,15 +1,55 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import json
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
 from pathlib import Path
 from datetime import datetime
-import os
+from contextlib import asynccontextmanager
 import asyncio
-from train_tone_of_voice import train_model
-from revise_response import rewrite_draft, load_model_and_tokenizer
+import json
+import os
+import threading
+import time
+# The ML stack (torch, transformers, peft) is only imported on first inference use
+from generation_config import BASE_MODEL_NAME, INFERENCE_PRECISION, generation_fingerprint
+from inference import (
+    rewrite_drafts, stream_draft, load_base_model, load_adapter, schedule_unload, unload_pending, adapter_nbytes,
+    merged_model_nbytes,
+)
+from pair_store import PairStore
+from adapter_cache import AdapterCache
+from response_cache import ResponseCache, response_key
+from adapter_store import ADAPTER_ROOT, account_dir, current_adapter, current_version
+from revise_batcher import RevisionBatcher
+from inference_executor import InferenceExecutor
+from inference_workers import InferenceWorkerPool
+from training_jobs import TrainingJobStore, TrainingJobDispatcher, ACTIVE_STATES
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from metrics import (
+    REVISE_STAGE_SECONDS, ADAPTER_CACHE_LOOKUPS, TRAINING_DURATION_SECONDS,
+    TRAINING_STEPS_PER_SECOND, PAIR_STORE_WRITE_SECONDS, PAIR_STORE_DUPLICATES,
+    RESPONSE_CACHE_LOOKUPS, RESPONSE_CACHE_SECONDS_SAVED, monitor_event_loop_lag,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    training_dispatcher.start()
+    global _event_loop
+    _event_loop = asyncio.get_running_loop()
+    if inference_pool is not None:
+        inference_pool.start(_event_loop)
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    warm_up_task = asyncio.create_task(warm_up()) if WARMUP_ON_STARTUP else None
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    lag_monitor.cancel()
+    training_dispatcher.stop()
+    inference_executor.shutdown()
+    if inference_pool is not None:
+        inference_pool.stop()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware to allow Next.js to call this service
 app.add_middleware(
@@ -20,15 +60,215 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Data storage
-DATA_PATH = Path("data/pairs.jsonl")
-DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
-OUTPUT_DIR = "outputs/tone_of_voice_lora"
-OUTPUT_DIR_PATH = Path(OUTPUT_DIR)
-OUTPUT_DIR_PATH.mkdir(parents=True, exist_ok=True)
+# Data storage (an existing data/pairs.jsonl is migrated on first start)
+pair_store = PairStore()
+ADAPTER_ROOT.mkdir(parents=True, exist_ok=True)
+
+# Adapters attached to the shared base model, keyed per user/account. Each
+# published version is attached under its own name ("{key}@{version}"), so a
+# retrained adapter can load next to the one still serving requests
+ADAPTER_CACHE_MAX_ENTRIES = int(os.getenv("ADAPTER_CACHE_MAX_ENTRIES", 8))
+# In int8-merged mode entries are whole models, about 7.5 GB each for Mistral 7B
+ADAPTER_CACHE_MAX_MB = int(os.getenv("ADAPTER_CACHE_MAX_MB", 16384 if INFERENCE_PRECISION == "int8-merged" else 4096))
+ADAPTER_CACHE_PINNED = [key for key in os.getenv("ADAPTER_CACHE_PINNED", "").split(",") if key]
+_model_cache = AdapterCache(
+    max_entries=ADAPTER_CACHE_MAX_ENTRIES,
+    max_bytes=ADAPTER_CACHE_MAX_MB * 2**20,
+    pinned=ADAPTER_CACHE_PINNED,
+    on_evict=lambda key, entry: evict_adapter(entry["adapter_name"]),
+)
+_event_loop = None
+
+# Model loading and generation run on a dedicated pool, off the event loop
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 2))
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", 32))
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", 5))
+inference_executor = InferenceExecutor(max_workers=INFERENCE_WORKERS, max_pending=INFERENCE_MAX_PENDING)
+
+def evict_adapter(adapter_name: str):
+    """
+    Frees an adapter that left the cache. Cache calls run on the event loop,
+    and detaching waits for any generation in progress, so it happens on the
+    inference pool.
+    """
+    schedule_unload(adapter_name)
+    inference_executor.submit(unload_pending)
+
+# With INFERENCE_PROCESSES > 0, generation runs in that many worker processes
+# instead (each account always served by the same one, which keeps its
+# adapter resident); BASE_WEIGHTS_MMAP=1 lets them share the base weights
+INFERENCE_PROCESSES = int(os.getenv("INFERENCE_PROCESSES", 0))
+INFERENCE_PROCESS_THREADS = int(os.getenv(
+    "INFERENCE_PROCESS_THREADS", max(1, (os.cpu_count() or 1) // max(1, INFERENCE_PROCESSES))
+))
+inference_pool = InferenceWorkerPool(INFERENCE_PROCESSES, {
+    "threads": INFERENCE_PROCESS_THREADS,
+    "max_entries": ADAPTER_CACHE_MAX_ENTRIES,
+    "max_bytes": ADAPTER_CACHE_MAX_MB * 2**20,
+    "pinned": ADAPTER_CACHE_PINNED,
+    "warm_up": os.getenv("WARMUP_ON_STARTUP", "1") != "0",
+}) if INFERENCE_PROCESSES > 0 else None
+
+# Concurrent /api/revise calls for the same adapter are generated together
+REVISE_BATCH_WINDOW_MS = float(os.getenv("REVISE_BATCH_WINDOW_MS", 20))
+REVISE_MAX_BATCH_SIZE = int(os.getenv("REVISE_MAX_BATCH_SIZE", 8))
+
+async def run_revisions(cache_key: str, drafts: list, entry: dict = None):
+    """
+    Revises drafts with an account's adapter: in its inference worker
+    process, or in-process with the acquired cache entry.
+    Returns (revisions, adapter version).
+    """
+    if inference_pool is not None:
+        result = await inference_pool.call(cache_key, "revise", drafts=drafts)
+        return result["revised"], result["version"]
+    revisions = await inference_executor.run(
+        rewrite_drafts, drafts, entry["model"], entry["tokenizer"], adapter_name=entry["adapter_name"]
+    )
+    return revisions, entry["version"]
+
+async def run_revision_batch(batch_key: str, items: list):
+    """Revise a micro-batch of drafts that share one adapter; returns (revised, version) per draft"""
+    revisions, version = await run_revisions(
+        items[0]["cache_key"], [item["draft_text"] for item in items], items[0].get("entry")
+    )
+    return [(revised, version) for revised in revisions]
+
+_revision_batcher = RevisionBatcher(
+    run_revision_batch,
+    window_ms=REVISE_BATCH_WINDOW_MS,
+    max_batch_size=REVISE_MAX_BATCH_SIZE,
+)
 
-# Model cache per user
-_model_cache = {}  # {f"{user_id}_{account_id}": (model, tokenizer)}
+# Limits of the bulk endpoints
+LOG_PAIRS_MAX_ITEMS = int(os.getenv("LOG_PAIRS_MAX_ITEMS", 10000))
+REVISE_BATCH_MAX_DRAFTS = int(os.getenv("REVISE_BATCH_MAX_DRAFTS", 32))
+
+# Opt-in cache of finished revisions, keyed by adapter version, normalized
+# draft text and generation settings
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 2048))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 3600))
+_response_cache = ResponseCache(max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS)
+
+def cached_revision(cache_key: str, version: str, draft_text: str):
+    """The cached revision of a draft for this adapter version, or None"""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    cached = _response_cache.get(response_key(cache_key, version, draft_text, generation_fingerprint()))
+    RESPONSE_CACHE_LOOKUPS.labels("miss" if cached is None else "hit").inc()
+    if cached is None:
+        return None
+    revised, generation_seconds = cached
+    RESPONSE_CACHE_SECONDS_SAVED.inc(generation_seconds)
+    return revised
+
+def cache_revision(cache_key: str, version: str, draft_text: str, revised: str, generation_seconds: float):
+    if RESPONSE_CACHE_ENABLED:
+        _response_cache.put(
+            response_key(cache_key, version, draft_text, generation_fingerprint()), revised, generation_seconds
+        )
+
+# Training runs in worker processes fed from a persistent job queue
+TRAINING_MAX_CONCURRENT = int(os.getenv("TRAINING_MAX_CONCURRENT", 1))
+
+def on_training_complete(job: dict):
+    """Swap in the new adapter in the background if the account's old one is loaded"""
+    print(f"Training completed for user {job['user_id']}, account {job['account_id']}")
+    cache_key = f"{job['user_id']}_{job['account_id']}"
+    _response_cache.invalidate(cache_key)
+    if inference_pool is not None:
+        # The account's worker loads the new version if it has the old one resident
+        if inference_pool.is_resident(cache_key) and _event_loop is not None:
+            asyncio.run_coroutine_threadsafe(inference_pool.call(cache_key, "load"), _event_loop)
+    elif cache_key in _model_cache and _event_loop is not None:
+        asyncio.run_coroutine_threadsafe(refresh_adapter(cache_key), _event_loop)
+    if job["started_at"] and job["finished_at"]:
+        duration = (
+            datetime.fromisoformat(job["finished_at"]) - datetime.fromisoformat(job["started_at"])
+        ).total_seconds()
+        TRAINING_DURATION_SECONDS.observe(duration)
+        if duration > 0:
+            TRAINING_STEPS_PER_SECOND.observe(job["step"] / duration)
+
+training_jobs = TrainingJobStore()
+training_dispatcher = TrainingJobDispatcher(
+    training_jobs,
+    max_concurrent=TRAINING_MAX_CONCURRENT,
+    on_complete=on_training_complete,
+)
+
+# Startup warm-up: load the base model, then the adapters of the most recently
+# active accounts (or PRELOAD_ACCOUNTS), in the background
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") != "0"
+PRELOAD_RECENT_ACCOUNTS = int(os.getenv("PRELOAD_RECENT_ACCOUNTS", 4))
+PRELOAD_ACCOUNTS = [key for key in os.getenv("PRELOAD_ACCOUNTS", "").split(",") if key]
+
+_warmup = {"state": "pending" if WARMUP_ON_STARTUP else "disabled", "adapters_loaded": 0, "adapters_total": 0}
+
+def preload_candidates() -> list:
+    """userId_accountId keys to preload: the configured list, or the most recently active accounts with an adapter"""
+    if PRELOAD_ACCOUNTS:
+        keys = PRELOAD_ACCOUNTS
+    else:
+        keys = [f"{user_id}_{account_id}" for user_id, account_id in pair_store.recent_accounts(100)]
+    keys = [key for key in keys if current_version(account_dir(key)) is not None]
+    limit = len(keys) if PRELOAD_ACCOUNTS else PRELOAD_RECENT_ACCOUNTS
+    return keys[:min(limit, ADAPTER_CACHE_MAX_ENTRIES)]
+
+async def check_merged_model_budget():
+    """
+    Raises RuntimeError if one merged int8 model doesn't fit ADAPTER_CACHE_MAX_MB
+    (int8-merged mode). Cache entries are whole models there; with a smaller
+    budget each would be evicted as soon as its request is done and reloaded
+    by the next one.
+    """
+    # Sized where the ML stack is imported anyway: an inference worker or the inference pool
+    if inference_pool is not None:
+        nbytes = (await inference_pool.call("", "merged_nbytes"))["nbytes"]
+    else:
+        nbytes = await inference_executor.run(merged_model_nbytes)
+    merged_mb = nbytes / 2**20
+    if merged_mb > ADAPTER_CACHE_MAX_MB:
+        raise RuntimeError(
+            f"ADAPTER_CACHE_MAX_MB={ADAPTER_CACHE_MAX_MB} is smaller than one merged int8 model "
+            f"({merged_mb:.0f} MB); raise it to use INFERENCE_PRECISION=int8-merged"
+        )
+
+async def warm_up():
+    """Loads the base model and preloads adapters while the service already answers requests"""
+    _warmup["state"] = "loading"
+    try:
+        if INFERENCE_PRECISION == "int8-merged":
+            await check_merged_model_budget()
+        if inference_pool is not None:
+            await inference_pool.wait_ready()
+        else:
+            await inference_executor.run(load_base_model)
+        keys = await asyncio.to_thread(preload_candidates)
+        _warmup["adapters_total"] = len(keys)
+        for key in keys:
+            if inference_pool is not None:
+                try:
+                    await inference_pool.call(key, "load")
+                except Exception as e:
+                    print(f"Failed to preload adapter {key}: {e}")
+                    continue
+            elif key not in _model_cache:
+                try:
+                    version, adapter_path = current_adapter(account_dir(key))
+                    model, tokenizer, nbytes, info = await load_adapter_version(key, version, adapter_path)
+                    _model_cache.put(key, model, tokenizer, nbytes, **info)
+                except Exception as e:
+                    print(f"Failed to preload adapter {key}: {e}")
+                    continue
+            _warmup["adapters_loaded"] += 1
+        _warmup["state"] = "ready"
+        print(f"Warm-up complete: base model and {_warmup['adapters_loaded']} adapter(s) loaded")
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        _warmup["state"] = "failed"
+        _warmup["error"] = str(e)
 
 class DraftFinalPair(BaseModel):
     draft: str
@@ -41,6 +281,11 @@ class RevisionRequest(BaseModel):
     userId: str
     accountId: str
 
+class BatchRevisionRequest(BaseModel):
+    drafts: list[str]
+    userId: str
+    accountId: str
+
 class TrainingStatus(BaseModel):
     userId: str
     accountId: str
@@ -50,7 +295,8 @@ async def root():
     return {
         "status": "Tone of Voice Service is running",
         "service": "instant-reply-fine-tuning",
-        "base_model": "mistralai/Mistral-7B-Instruct-v0.2"
+        "base_model": BASE_MODEL_NAME,
+        "inference_precision": INFERENCE_PRECISION
     }
 
 @app.get("/api/health")
@@ -58,22 +304,39 @@ async def health():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/api/ready")
+async def ready():
+    """Readiness check: 200 once the startup warm-up has finished, 503 until then"""
+    is_ready = _warmup["state"] in ("ready", "disabled")
+    body = {"ready": is_ready, "warmup": _warmup}
+    if not is_ready:
+        raise HTTPException(status_code=503, detail=body)
+    return body
+
 @app.post("/api/log-pair")
 async def log_pair(pair: DraftFinalPair):
-    """Store a draft/final pair for training"""
+    """Store a draft/final pair for training, unless the account already has it"""
     try:
-        record = {
-            "draft": pair.draft,
-            "final": pair.final,
-            "userId": pair.userId,
-            "accountId": pair.accountId,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        
-        with DATA_PATH.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # Off the event loop: the commit fsyncs and the store lock may be held by another write
+        with PAIR_STORE_WRITE_SECONDS.time():
+            status, pair_id = await asyncio.to_thread(
+                pair_store.add_pair,
+                pair.userId,
+                pair.accountId,
+                pair.draft,
+                pair.final,
+                datetime.utcnow().isoformat(),
+            )
         
-        count = count_pairs()
+        count = await asyncio.to_thread(count_pairs)
+        if status != "logged":
+            PAIR_STORE_DUPLICATES.labels(status).inc()
+            return {
+                "status": status,
+                "duplicate_of": pair_id,
+                "count": count,
+                "message": f"Pair already logged as pair {pair_id}, not stored again. Total pairs: {count}"
+            }
         return {
             "status": "logged",
             "count": count,
@@ -82,37 +345,201 @@ async def log_pair(pair: DraftFinalPair):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to log pair: {str(e)}")
 
+def parse_pair_items(body: bytes, content_type: str) -> list:
+    """Items of a /api/log-pairs body: a JSON array, {"pairs": [...]} or NDJSON (one pair per line)"""
+    text = body.decode("utf-8")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        items = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(e)
+        return items
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("pairs")
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of pairs, {\"pairs\": [...]} or NDJSON")
+    return data
+
+@app.post("/api/log-pairs")
+async def log_pairs(request: Request):
+    """
+    Store many draft/final pairs, e.g. for backfills (committed in chunks
+    of ADD_PAIRS_CHUNK).
+    Accepts a JSON array (or {"pairs": [...]}) or NDJSON; invalid and
+    duplicate items are reported per item and don't prevent the others
+    from being stored.
+    """
+    try:
+        items = parse_pair_items(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid request body: {str(e)}")
+    if len(items) > LOG_PAIRS_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {LOG_PAIRS_MAX_ITEMS} pairs per request")
+    
+    results = []
+    rows = []
+    timestamp = datetime.utcnow().isoformat()
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, Exception):
+                raise item
+            pair = DraftFinalPair.model_validate(item)
+        except ValidationError as e:
+            error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            results.append({"index": index, "status": "invalid", "error": error})
+            continue
+        except ValueError as e:
+            results.append({"index": index, "status": "invalid", "error": str(e)})
+            continue
+        results.append({"index": index, "status": "logged"})
+        rows.append((pair.userId, pair.accountId, pair.draft, pair.final, timestamp))
+    
+    try:
+        stored = await asyncio.to_thread(pair_store.add_pairs, rows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to log pairs: {str(e)}")
+    stored_iter = iter(stored)
+    for result in results:
+        if result["status"] == "logged":
+            status, pair_id = next(stored_iter)
+            if status == "logged":
+                result["id"] = pair_id
+            else:
+                PAIR_STORE_DUPLICATES.labels(status).inc()
+                result.update(status=status, duplicate_of=pair_id)
+    
+    logged = sum(1 for status, _ in stored if status == "logged")
+    return {
+        "status": "logged" if logged == len(items) else "partial",
+        "logged": logged,
+        "duplicates": len(stored) - logged,
+        "invalid": len(items) - len(stored),
+        "count": await asyncio.to_thread(count_pairs),
+        "results": results
+    }
+
+def load_adapter_sized(adapter_name: str, adapter_path: str):
+    """load_adapter() plus the adapter's size, both on the inference pool"""
+    model, tokenizer = load_adapter(adapter_name, adapter_path)
+    return model, tokenizer, adapter_nbytes(model, adapter_name)
+
+async def load_adapter_version(cache_key: str, version: str, adapter_path: Path):
+    """Attaches one adapter version to the base model; returns the arguments for _model_cache.put()"""
+    adapter_name = f"{cache_key}@{version}"
+    model, tokenizer, nbytes = await inference_executor.run(load_adapter_sized, adapter_name, str(adapter_path))
+    return model, tokenizer, nbytes, {"version": version, "adapter_name": adapter_name}
+
+_refreshing = set()
+
+async def refresh_adapter(cache_key: str):
+    """
+    Loads a newly published adapter version while the resident one keeps
+    serving requests, then swaps it into the cache.
+    """
+    if cache_key in _refreshing:
+        return
+    _refreshing.add(cache_key)
+    try:
+        version, adapter_path = current_adapter(account_dir(cache_key))
+        entry = _model_cache.peek(cache_key)
+        if version is None or entry is None or entry["version"] == version:
+            return
+        print(f"Loading adapter {cache_key} version {version} (serving {entry['version']} meanwhile)")
+        model, tokenizer, nbytes, info = await load_adapter_version(cache_key, version, adapter_path)
+        _model_cache.replace(cache_key, model, tokenizer, nbytes, **info)
+        print(f"Swapped adapter {cache_key} to version {version}")
+    except Exception as e:
+        print(f"Failed to refresh adapter {cache_key}: {e}")
+    finally:
+        _refreshing.discard(cache_key)
+
+async def acquire_adapter(cache_key: str) -> dict:
+    """
+    Returns the cache entry for an account's adapter, acquired for use,
+    loading the published version onto the shared base model on a cache miss.
+    If a newer version was published, the resident one is returned while
+    the new one loads in the background.
+    Callers must release it with _model_cache.release(cache_key, entry).
+    """
+    version, adapter_path = current_adapter(account_dir(cache_key))
+    with REVISE_STAGE_SECONDS.labels("cache_lookup").time():
+        entry = _model_cache.acquire(cache_key)
+    ADAPTER_CACHE_LOOKUPS.labels("miss" if entry is None else "hit").inc()
+    if entry is None:
+        print(f"Loading adapter {cache_key} version {version}")
+        with REVISE_STAGE_SECONDS.labels("adapter_load").time():
+            model, tokenizer, nbytes, info = await load_adapter_version(cache_key, version, adapter_path)
+        entry = _model_cache.put(cache_key, model, tokenizer, nbytes, in_use=True, **info)
+    elif version is not None and entry["version"] != version:
+        asyncio.ensure_future(refresh_adapter(cache_key))
+    return entry
+
 @app.post("/api/revise")
 async def revise_draft(request: RevisionRequest):
     """Revise a draft using the fine-tuned Mistral model"""
     cache_key = f"{request.userId}_{request.accountId}"
     
+    # Check if model exists for this user
+    version = current_version(account_dir(cache_key))
+    if version is None:
+        # No fine-tuned model yet, return original
+        return {
+            "revised": request.draft_text,
+            "model_used": "none",
+            "message": "No fine-tuned model available yet. Training will start when enough data is collected."
+        }
+    
+    revised = cached_revision(cache_key, version, request.draft_text)
+    if revised is not None:
+        return {
+            "revised": revised,
+            "model_used": "mistral-fine-tuned",
+            "cache_hit": True,
+            "original_length": len(request.draft_text),
+            "revised_length": len(revised)
+        }
+    
+    # Reject quickly instead of queueing without bound behind running generations
+    if not inference_executor.try_acquire():
+        raise HTTPException(
+            status_code=503,
+            detail="Inference queue is full. Please retry later.",
+            headers={"Retry-After": str(INFERENCE_RETRY_AFTER)},
+        )
+    
     try:
-        # Check if model exists for this user
-        user_output_dir = OUTPUT_DIR_PATH / f"{request.userId}_{request.accountId}"
-        
-        if not user_output_dir.exists() or not (user_output_dir / "adapter_config.json").exists():
-            # No fine-tuned model yet, return original
-            return {
-                "revised": request.draft_text,
-                "model_used": "none",
-                "message": "No fine-tuned model available yet. Training will start when enough data is collected."
-            }
-        
-        # Load model from cache or disk
-        if cache_key not in _model_cache:
-            print(f"Loading model for user {request.userId}, account {request.accountId}")
-            model, tokenizer = load_model_and_tokenizer(str(user_output_dir))
-            _model_cache[cache_key] = (model, tokenizer)
-        
-        model, tokenizer = _model_cache[cache_key]
-        
-        # Revise the draft
-        revised = rewrite_draft(request.draft_text, model, tokenizer)
+        if inference_pool is not None:
+            # The account's worker process loads its adapter itself
+            started = time.perf_counter()
+            revised, version = await _revision_batcher.submit(cache_key, {
+                "cache_key": cache_key,
+                "draft_text": request.draft_text,
+            })
+        else:
+            # Attach the user's adapter to the shared base model if not loaded yet
+            entry = await acquire_adapter(cache_key)
+            
+            # Revise the draft with this user's adapter active
+            started = time.perf_counter()
+            try:
+                revised, version = await _revision_batcher.submit(entry["adapter_name"], {
+                    "cache_key": cache_key,
+                    "draft_text": request.draft_text,
+                    "entry": entry,
+                })
+            finally:
+                _model_cache.release(cache_key, entry)
+        cache_revision(cache_key, version, request.draft_text, revised, time.perf_counter() - started)
         
         return {
             "revised": revised,
             "model_used": "mistral-fine-tuned",
+            "cache_hit": False,
             "original_length": len(request.draft_text),
             "revised_length": len(revised)
         }
@@ -124,12 +551,227 @@ async def revise_draft(request: RevisionRequest):
             "model_used": "fallback",
             "error": str(e)
         }
+    finally:
+        inference_executor.release()
+
+@app.post("/api/revise-batch")
+async def revise_drafts(request: BatchRevisionRequest):
+    """
+    Revise many drafts of one account. Cached drafts are answered from the
+    response cache, the rest are generated in batches of REVISE_MAX_BATCH_SIZE.
+    Every draft gets its own result; a failed batch falls back to the originals.
+    """
+    if len(request.drafts) > REVISE_BATCH_MAX_DRAFTS:
+        raise HTTPException(status_code=413, detail=f"At most {REVISE_BATCH_MAX_DRAFTS} drafts per request")
+    cache_key = f"{request.userId}_{request.accountId}"
+    
+    version = current_version(account_dir(cache_key))
+    if version is None:
+        return {
+            "model_used": "none",
+            "message": "No fine-tuned model available yet. Training will start when enough data is collected.",
+            "results": [
+                {"index": index, "status": "unchanged", "revised": draft, "cache_hit": False}
+                for index, draft in enumerate(request.drafts)
+            ]
+        }
+    
+    results = [None] * len(request.drafts)
+    pending = []
+    for index, draft in enumerate(request.drafts):
+        revised = cached_revision(cache_key, version, draft)
+        if revised is None:
+            pending.append(index)
+        else:
+            results[index] = {"index": index, "status": "revised", "revised": revised, "cache_hit": True}
+    
+    if pending:
+        if not inference_executor.try_acquire():
+            raise HTTPException(
+                status_code=503,
+                detail="Inference queue is full. Please retry later.",
+                headers={"Retry-After": str(INFERENCE_RETRY_AFTER)},
+            )
+        entry = None
+        try:
+            if inference_pool is None:
+                entry = await acquire_adapter(cache_key)
+            for start in range(0, len(pending), REVISE_MAX_BATCH_SIZE):
+                indexes = pending[start:start + REVISE_MAX_BATCH_SIZE]
+                drafts = [request.drafts[index] for index in indexes]
+                started = time.perf_counter()
+                try:
+                    revisions, version = await run_revisions(cache_key, drafts, entry)
+                except Exception as e:
+                    print(f"Error revising draft batch: {e}")
+                    for index in indexes:
+                        results[index] = {
+                            "index": index, "status": "fallback", "revised": request.drafts[index],
+                            "cache_hit": False, "error": str(e)
+                        }
+                    continue
+                # Each draft is credited its share of the batch
+                generation_seconds = (time.perf_counter() - started) / len(indexes)
+                for index, revised in zip(indexes, revisions):
+                    cache_revision(cache_key, version, request.drafts[index], revised, generation_seconds)
+                    results[index] = {"index": index, "status": "revised", "revised": revised, "cache_hit": False}
+        except Exception as e:
+            print(f"Error revising drafts: {e}")
+            for index in pending:
+                if results[index] is None:
+                    results[index] = {
+                        "index": index, "status": "fallback", "revised": request.drafts[index],
+                        "cache_hit": False, "error": str(e)
+                    }
+        finally:
+            if entry is not None:
+                _model_cache.release(cache_key, entry)
+            inference_executor.release()
+    
+    return {
+        "model_used": "mistral-fine-tuned",
+        "revised": sum(result["status"] == "revised" for result in results),
+        "failed": sum(result["status"] == "fallback" for result in results),
+        "results": results
+    }
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/revise-stream")
+async def revise_draft_stream(request: RevisionRequest):
+    """
+    Revise a draft, streaming the revision as Server-Sent Events.
+    "token" events carry text as it is generated; the closing "done" event
+    carries the final cleaned revision, like /api/revise returns it.
+    """
+    cache_key = f"{request.userId}_{request.accountId}"
+    version = current_version(account_dir(cache_key))
+    
+    if version is None:
+        async def no_model_stream():
+            yield sse_event("done", {
+                "revised": request.draft_text,
+                "model_used": "none",
+                "message": "No fine-tuned model available yet. Training will start when enough data is collected."
+            })
+        return StreamingResponse(no_model_stream(), media_type="text/event-stream")
+    
+    revised = cached_revision(cache_key, version, request.draft_text)
+    if revised is not None:
+        async def cached_stream():
+            yield sse_event("token", {"text": revised})
+            yield sse_event("done", {
+                "revised": revised,
+                "model_used": "mistral-fine-tuned",
+                "cache_hit": True,
+                "original_length": len(request.draft_text),
+                "revised_length": len(revised)
+            })
+        return StreamingResponse(cached_stream(), media_type="text/event-stream")
+    
+    if not inference_executor.try_acquire():
+        raise HTTPException(
+            status_code=503,
+            detail="Inference queue is full. Please retry later.",
+            headers={"Retry-After": str(INFERENCE_RETRY_AFTER)},
+        )
+    
+    async def event_stream():
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        stop_event = threading.Event()
+        entry = None
+        
+        def generate(model, tokenizer, adapter_name):
+            try:
+                return stream_draft(
+                    request.draft_text, model, tokenizer,
+                    on_text=lambda text: loop.call_soon_threadsafe(chunks.put_nowait, text),
+                    adapter_name=adapter_name,
+                    stop_event=stop_event,
+                )
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+        
+        try:
+            entry = await acquire_adapter(cache_key)
+            started = time.perf_counter()
+            
+            generation = asyncio.ensure_future(
+                inference_executor.run(generate, entry["model"], entry["tokenizer"], entry["adapter_name"])
+            )
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                yield sse_event("token", {"text": chunk})
+            revised = await generation
+            cache_revision(cache_key, entry["version"], request.draft_text, revised, time.perf_counter() - started)
+            
+            yield sse_event("done", {
+                "revised": revised,
+                "model_used": "mistral-fine-tuned",
+                "cache_hit": False,
+                "original_length": len(request.draft_text),
+                "revised_length": len(revised)
+            })
+        except Exception as e:
+            print(f"Error streaming revision: {e}")
+            yield sse_event("done", {
+                "revised": request.draft_text,
+                "model_used": "fallback",
+                "error": str(e)
+            })
+        finally:
+            # Also reached when the client disconnects and the stream is closed
+            stop_event.set()
+            if entry is not None:
+                _model_cache.release(cache_key, entry)
+            inference_executor.release()
+    
+    async def worker_event_stream():
+        # Same events, generated by the account's inference worker process
+        events = inference_pool.stream(cache_key, request.draft_text)
+        try:
+            started = time.perf_counter()
+            result = None
+            async for kind, data in events:
+                if kind == "token":
+                    yield sse_event("token", {"text": data})
+                else:
+                    result = data
+            revised = result["revised"]
+            cache_revision(cache_key, result["version"], request.draft_text, revised, time.perf_counter() - started)
+            
+            yield sse_event("done", {
+                "revised": revised,
+                "model_used": "mistral-fine-tuned",
+                "cache_hit": False,
+                "original_length": len(request.draft_text),
+                "revised_length": len(revised)
+            })
+        except Exception as e:
+            print(f"Error streaming revision: {e}")
+            yield sse_event("done", {
+                "revised": request.draft_text,
+                "model_used": "fallback",
+                "error": str(e)
+            })
+        finally:
+            # Closing the events early tells the worker to stop generating
+            await events.aclose()
+            inference_executor.release()
+    
+    stream = worker_event_stream() if inference_pool is not None else event_stream()
+    return StreamingResponse(stream, media_type="text/event-stream")
 
 @app.post("/api/trigger-fine-tuning")
 async def trigger_fine_tuning(status: TrainingStatus):
     """Trigger fine-tuning for a specific user/account"""
     try:
-        count = count_pairs_for_user(status.userId, status.accountId)
+        count = await asyncio.to_thread(count_pairs_for_user, status.userId, status.accountId)
         
         if count < 10:  # Minimum examples needed
             return {
@@ -138,13 +780,22 @@ async def trigger_fine_tuning(status: TrainingStatus):
                 "message": f"Need at least 10 examples. Currently have {count}."
             }
         
-        # Run training in background
-        asyncio.create_task(train_for_user(status.userId, status.accountId))
+        # Queue training; a worker process picks it up
+        job, created = training_jobs.enqueue(status.userId, status.accountId)
+        
+        if not created:
+            return {
+                "status": "already_" + job["state"],
+                "count": count,
+                "job": job,
+                "message": f"Fine-tuning is already {job['state']} for this account."
+            }
         
         return {
             "status": "started",
             "count": count,
-            "message": f"Fine-tuning started with {count} examples. This may take several minutes."
+            "job": job,
+            "message": f"Fine-tuning queued with {count} examples. This may take several minutes."
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to trigger fine-tuning: {str(e)}")
@@ -153,60 +804,68 @@ async def trigger_fine_tuning(status: TrainingStatus):
 async def get_status(user_id: str, account_id: str):
     """Get training status for a user/account"""
     try:
-        count = count_pairs_for_user(user_id, account_id)
-        user_output_dir = OUTPUT_DIR_PATH / f"{user_id}_{account_id}"
-        model_exists = user_output_dir.exists() and (user_output_dir / "adapter_config.json").exists()
+        count = await asyncio.to_thread(count_pairs_for_user, user_id, account_id)
+        model_version = current_version(account_dir(f"{user_id}_{account_id}"))
         
         return {
             "pairs_count": count,
-            "model_exists": model_exists,
-            "model_loaded": f"{user_id}_{account_id}" in _model_cache,
-            "ready_for_training": count >= 10
+            "model_exists": model_version is not None,
+            "model_version": model_version,
+            "model_loaded": (
+                inference_pool.is_resident(f"{user_id}_{account_id}") if inference_pool is not None
+                else f"{user_id}_{account_id}" in _model_cache
+            ),
+            "ready_for_training": count >= 10,
+            "training_job": training_jobs.latest_for_account(user_id, account_id)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get status: {str(e)}")
 
-async def train_for_user(user_id: str, account_id: str):
-    """Background task to train model for a user"""
-    try:
-        print(f"Starting training for user {user_id}, account {account_id}")
-        train_model(user_id, account_id)
-        
-        # Clear cache to force reload
-        cache_key = f"{user_id}_{account_id}"
-        if cache_key in _model_cache:
-            del _model_cache[cache_key]
-        
-        print(f"Training completed for user {user_id}, account {account_id}")
-    except Exception as e:
-        print(f"Training failed for user {user_id}, account {account_id}: {e}")
+@app.post("/api/cancel-fine-tuning")
+async def cancel_fine_tuning(status: TrainingStatus):
+    """Cancel the queued or running fine-tuning job for a user/account"""
+    job = training_jobs.latest_for_account(status.userId, status.accountId)
+    if job is None or job["state"] not in ACTIVE_STATES:
+        raise HTTPException(status_code=404, detail="No active fine-tuning job for this account")
+    
+    job = training_jobs.request_cancel(job["id"])
+    return {
+        "status": "cancelled" if job["state"] == "cancelled" else "cancelling",
+        "job": job
+    }
+
+@app.get("/api/status")
+async def get_service_status():
+    """Get adapter cache statistics and the adapters currently resident"""
+    return {
+        "pairs_count": await asyncio.to_thread(count_pairs),
+        "adapter_cache": _model_cache.stats(),
+        "response_cache": {"enabled": RESPONSE_CACHE_ENABLED, **_response_cache.stats()},
+        "resident_adapters": _model_cache.resident(),
+        "revise_batching": _revision_batcher.stats(),
+        "inference": inference_executor.stats(),
+        "inference_workers": inference_pool.stats() if inference_pool is not None else None,
+        "training_jobs": training_jobs.counts(),
+        "warmup": _warmup,
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 def count_pairs():
-    """Count total pairs in data file"""
-    if not DATA_PATH.exists():
-        return 0
+    """Count total pairs in the pair store"""
     try:
-        with DATA_PATH.open("r", encoding="utf-8") as f:
-            return sum(1 for _ in f)
-    except:
+        return pair_store.count_pairs()
+    except Exception:
         return 0
 
 def count_pairs_for_user(user_id: str, account_id: str):
     """Count pairs for a specific user/account"""
-    if not DATA_PATH.exists():
-        return 0
     try:
-        count = 0
-        with DATA_PATH.open("r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    record = json.loads(line)
-                    if record.get("userId") == user_id and record.get("accountId") == account_id:
-                        count += 1
-                except:
-                    continue
-        return count
-    except:
+        return pair_store.count_pairs_for_user(user_id, account_id)
+    except Exception:
         return 0
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from prometheus_client import Counter, Histogram
+
+# Stages of a revision: cache_lookup, adapter_load, tokenize, prefill, decode, cleanup
+REVISE_STAGE_SECONDS = Histogram(
+    "revise_stage_seconds",
+    "Time spent in each stage of a revision",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+REVISE_GENERATED_TOKENS = Histogram(
+    "revise_generated_tokens",
+    "Tokens generated per revision",
+    buckets=(8, 16, 32, 64, 96, 128, 192, 256, 300),
+)
+ASSISTED_DECODING_TOKENS = Counter(
+    "assisted_decoding_tokens_total",
+    "Candidate tokens proposed by prompt lookup, and those the model accepted",
+    ["result"],
+)
+ADAPTER_CACHE_LOOKUPS = Counter(
+    "adapter_cache_lookups_total",
+    "Adapter cache lookups by result (hit or miss)",
+    ["result"],
+)
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "response_cache_lookups_total",
+    "Revision response cache lookups by result (hit or miss)",
+    ["result"],
+)
+RESPONSE_CACHE_SECONDS_SAVED = Counter(
+    "response_cache_generation_seconds_saved_total",
+    "Generation time the cached revisions originally took, summed over cache hits",
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "Delay of a periodic event loop wakeup beyond its scheduled time",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+TRAINING_DURATION_SECONDS = Histogram(
+    "training_duration_seconds",
+    "Wall time of completed training jobs",
+    buckets=(30, 60, 120, 300, 600, 1200, 1800, 3600, 7200),
+)
+TRAINING_STEPS_PER_SECOND = Histogram(
+    "training_steps_per_second",
+    "Optimizer steps per second of completed training jobs",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 25),
+)
+PAIR_STORE_WRITE_SECONDS = Histogram(
+    "pair_store_write_seconds",
+    "Latency of writing one pair to the pair store",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+PAIR_STORE_DUPLICATES = Counter(
+    "pair_store_duplicates_total",
+    "Logged pairs not stored because the account already has them",
+    ["kind"],
+)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Records how late the event loop wakes up from a sleep, until cancelled"""
+    while True:
+        scheduled = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, time.perf_counter() - scheduled))
@@ -0,0 +1,82 @@
+import json
+import mmap
+import struct
+from pathlib import Path
+
+import torch
+from accelerate import init_empty_weights
+from transformers import AutoConfig, AutoModelForCausalLM
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def resolve_snapshot(model_name: str) -> Path:
+    """Local directory with the model's config and safetensors files, downloading them if needed"""
+    if Path(model_name).is_dir():
+        return Path(model_name)
+    from huggingface_hub import snapshot_download
+    return Path(snapshot_download(model_name, allow_patterns=["*.json", "*.safetensors"]))
+
+
+def load_safetensors_mmap(path: Path) -> dict:
+    """
+    Tensors of a safetensors file as zero-copy views into a private,
+    copy-on-write memory map of it. Pages are read from the OS page cache,
+    so processes mapping the same file share one copy of the weights; a
+    write only copies the page it touches.
+    """
+    with open(path, "rb") as f:
+        header_length = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_length))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    data_start = 8 + header_length
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        if end == start:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        count = (end - start) // torch.tensor([], dtype=dtype).element_size()
+        tensors[name] = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + start).view(info["shape"])
+    return tensors
+
+
+def load_model_mmap(model_name: str):
+    """
+    Builds the causal LM with its parameters on the meta device and assigns
+    the memory-mapped tensors in place of them, so no weight is copied into
+    process memory. The model keeps the dtype the snapshot was saved in.
+    """
+    snapshot = resolve_snapshot(model_name)
+    files = sorted(snapshot.glob("*.safetensors"))
+    if not files:
+        raise FileNotFoundError(f"No safetensors weights in {snapshot}")
+    state_dict = {}
+    for path in files:
+        state_dict.update(load_safetensors_mmap(path))
+
+    config = AutoConfig.from_pretrained(snapshot)
+    # Buffers (e.g. rotary embeddings) are computed at init and stay real
+    with init_empty_weights(include_buffers=False):
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=next(iter(state_dict.values())).dtype)
+    model.load_state_dict(state_dict, strict=False, assign=True)
+    if getattr(config, "tie_word_embeddings", False):
+        model.tie_weights()
+    missing = [name for name, param in model.named_parameters() if param.is_meta]
+    if missing:
+        raise ValueError(f"Weights missing from {snapshot}: {', '.join(missing[:5])}")
+    return model
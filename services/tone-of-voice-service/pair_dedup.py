@@ -0,0 +1,40 @@
+import hashlib
+import re
+
+from response_cache import normalize_draft
+
+SIMHASH_BITS = 64
+_MASK = (1 << SIMHASH_BITS) - 1
+_WORD = re.compile(r"\w+")
+_DIGITS = re.compile(r"\d+")
+
+
+def content_hash(draft: str, final: str) -> str:
+    """Identity of a pair for exact deduplication: line endings, trailing spaces and outer blank lines don't count"""
+    return hashlib.sha256(f"{normalize_draft(draft)}\0{normalize_draft(final)}".encode("utf-8")).hexdigest()
+
+
+def _features(prefix: str, text: str) -> list:
+    """Words and word bigrams of the text, lowercased, with punctuation dropped and numbers folded together"""
+    words = _WORD.findall(_DIGITS.sub("0", text.lower()))
+    return [f"{prefix}{word}" for word in words] + [f"{prefix}{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def simhash(draft: str, final: str) -> int:
+    """
+    64-bit SimHash of a pair over the words and word bigrams of its draft
+    and final. Pairs that differ in a few words (a name, a date,
+    punctuation) get fingerprints a few bits apart; unrelated pairs differ in about half of
+    the bits. Returned as a signed integer so SQLite can store it.
+    """
+    counts = [0] * SIMHASH_BITS
+    for feature in _features("d:", draft) + _features("f:", final):
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            counts[bit] += 1 if value >> bit & 1 else -1
+    fingerprint = sum(1 << bit for bit, count in enumerate(counts) if count > 0)
+    return fingerprint - (1 << SIMHASH_BITS) if fingerprint >> (SIMHASH_BITS - 1) else fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin((a ^ b) & _MASK).count("1")
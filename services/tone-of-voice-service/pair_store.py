@@ -0,0 +1,341 @@
+import heapq
+import json
+import math
+import os
+import random
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from pair_dedup import content_hash, hamming_distance, simhash
+
+DB_PATH = Path("data/pairs.db")
+LEGACY_DATA_PATH = Path("data/pairs.jsonl")
+
+# SQLite's fsync policy for pair writes: FULL syncs every commit; NORMAL (safe
+# in WAL mode, but the last commits can be lost on power failure) syncs at
+# checkpoints only, which makes large backfills considerably faster
+PAIR_STORE_SYNCHRONOUS = os.getenv("PAIR_STORE_SYNCHRONOUS", "FULL").upper()
+
+# Pairs identical to one the account already has (see pair_dedup.content_hash)
+# are never stored. With PAIR_NEAR_DEDUP=1, neither are pairs whose SimHash is
+# within PAIR_NEAR_DUP_DISTANCE bits of one of the account's last
+# PAIR_NEAR_DUP_WINDOW pairs
+PAIR_NEAR_DEDUP = os.getenv("PAIR_NEAR_DEDUP", "0") == "1"
+PAIR_NEAR_DUP_DISTANCE = int(os.getenv("PAIR_NEAR_DUP_DISTANCE", 6))
+PAIR_NEAR_DUP_WINDOW = int(os.getenv("PAIR_NEAR_DUP_WINDOW", 1000))
+
+# add_pairs() commits in chunks of this many pairs, releasing the store lock in
+# between so reads aren't held up for the whole of a large backfill
+ADD_PAIRS_CHUNK = 250
+
+# Version of the schema after _migrate_schema(), kept in PRAGMA user_version
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pairs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    draft TEXT NOT NULL,
+    final TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_pairs_account ON pairs (user_id, account_id, id);
+
+CREATE TABLE IF NOT EXISTS pair_counts (
+    user_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    last_timestamp TEXT,
+    PRIMARY KEY (user_id, account_id)
+);
+
+CREATE TABLE IF NOT EXISTS pair_total (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    count INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO pair_total (id, count) VALUES (0, 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_pairs_count AFTER INSERT ON pairs
+BEGIN
+    UPDATE pair_total SET count = count + 1 WHERE id = 0;
+    INSERT INTO pair_counts (user_id, account_id, count, last_timestamp)
+    VALUES (NEW.user_id, NEW.account_id, 1, NEW.timestamp)
+    ON CONFLICT (user_id, account_id) DO UPDATE SET
+        count = count + 1,
+        last_timestamp = NEW.timestamp;
+END;
+"""
+
+
+class PairStore:
+    """
+    Draft/final pairs in an embedded SQLite database.
+
+    Pairs are indexed by (user_id, account_id) and a per-account count is
+    maintained by trigger, so counting is a single-row lookup and reading one
+    account's pairs never touches anyone else's data. Duplicate pairs of an
+    account are rejected on insert.
+    """
+
+    def __init__(self, db_path: Path = DB_PATH, legacy_path: Path = LEGACY_DATA_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        if PAIR_STORE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Unknown PAIR_STORE_SYNCHRONOUS: {PAIR_STORE_SYNCHRONOUS}")
+        self._conn.execute(f"PRAGMA synchronous={PAIR_STORE_SYNCHRONOUS}")
+        self._conn.executescript(SCHEMA)
+        self._migrate_schema()
+        self._migrate_legacy_jsonl(Path(legacy_path))
+
+    def _migrate_schema(self):
+        """Brings the database up to SCHEMA_VERSION, one version at a time"""
+        with self._lock:
+            # IMMEDIATE, so a second process starting concurrently waits and then skips
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+                if version < 1:
+                    self._add_content_hashes()
+                if version < 2:
+                    self._backfill_simhashes()
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def _add_content_hashes(self):
+        """Version 1: pair content hashes, unique per account, and SimHash fingerprints"""
+        self._conn.execute("ALTER TABLE pairs ADD COLUMN content_hash TEXT")
+        self._conn.execute("ALTER TABLE pairs ADD COLUMN simhash INTEGER")
+        last_id = 0
+        while True:
+            rows = self._conn.execute(
+                "SELECT id, draft, final FROM pairs WHERE id > ? ORDER BY id LIMIT 10000", (last_id,)
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany(
+                "UPDATE pairs SET content_hash = ? WHERE id = ?",
+                [(content_hash(row["draft"], row["final"]), row["id"]) for row in rows],
+            )
+            last_id = rows[-1]["id"]
+
+        # Keep the first of each set of duplicates, which older watermarks refer to
+        removed = self._conn.execute(
+            "DELETE FROM pairs WHERE id NOT IN "
+            "(SELECT MIN(id) FROM pairs GROUP BY user_id, account_id, content_hash)"
+        ).rowcount
+        if removed:
+            self._conn.execute("DELETE FROM pair_counts")
+            self._conn.execute(
+                "INSERT INTO pair_counts (user_id, account_id, count, last_timestamp) "
+                "SELECT user_id, account_id, COUNT(*), MAX(timestamp) FROM pairs GROUP BY user_id, account_id"
+            )
+            self._conn.execute("UPDATE pair_total SET count = (SELECT COUNT(*) FROM pairs) WHERE id = 0")
+            print(f"Removed {removed} duplicate pairs from {self.db_path}")
+        self._conn.execute("CREATE UNIQUE INDEX idx_pairs_content ON pairs (user_id, account_id, content_hash)")
+
+    def _backfill_simhashes(self):
+        """
+        Version 2: SimHash fingerprints for the pairs near-duplicate detection
+        compares against. New pairs get one on insert, even with
+        PAIR_NEAR_DEDUP off, so this runs once rather than on every open.
+        """
+        rows = self._conn.execute(
+            "SELECT id, draft, final FROM ("
+            "  SELECT id, draft, final, simhash, ROW_NUMBER() OVER ("
+            "    PARTITION BY user_id, account_id ORDER BY id DESC) AS recency FROM pairs"
+            ") WHERE recency <= ? AND simhash IS NULL",
+            (PAIR_NEAR_DUP_WINDOW,),
+        ).fetchall()
+        self._conn.executemany(
+            "UPDATE pairs SET simhash = ? WHERE id = ?",
+            [(simhash(row["draft"], row["final"]), row["id"]) for row in rows],
+        )
+
+    def _migrate_legacy_jsonl(self, legacy_path: Path):
+        """Import an existing pairs.jsonl in one pass, then move it aside"""
+        if not legacy_path.exists():
+            return
+
+        # Claim the file first so a second process starting concurrently skips it
+        claimed_path = legacy_path.with_name(legacy_path.name + ".migrating")
+        try:
+            legacy_path.rename(claimed_path)
+        except OSError:
+            return
+
+        def rows():
+            with claimed_path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        yield (
+                            record["userId"],
+                            record["accountId"],
+                            record["draft"],
+                            record["final"],
+                            record.get("timestamp") or datetime.utcnow().isoformat(),
+                            content_hash(record["draft"], record["final"]),
+                        )
+                    except (ValueError, KeyError, TypeError):
+                        continue
+
+        print(f"Migrating {legacy_path} into {self.db_path}")
+        with self._lock, self._conn:
+            # Duplicates in the file are skipped by the unique content hash index
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO pairs (user_id, account_id, draft, final, timestamp, content_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows(),
+            )
+            # Fingerprinted afterwards, only as far back as near-duplicate detection looks
+            self._backfill_simhashes()
+        claimed_path.rename(legacy_path.with_name(legacy_path.name + ".migrated"))
+
+    def _insert_pair(self, user_id: str, account_id: str, draft: str, final: str, timestamp: str,
+                     fingerprint: int) -> tuple:
+        """
+        Inserts a pair unless it is a duplicate; returns (status, pair id), see
+        add_pairs(). fingerprint is simhash(draft, final), computed by the
+        caller before taking the store lock.
+        """
+        digest = content_hash(draft, final)
+        row = self._conn.execute(
+            "SELECT id FROM pairs WHERE user_id = ? AND account_id = ? AND content_hash = ?",
+            (user_id, account_id, digest),
+        ).fetchone()
+        if row:
+            return "duplicate", row["id"]
+
+        # Always stored, so turning PAIR_NEAR_DEDUP on later needs no backfill
+        if PAIR_NEAR_DEDUP:
+            recent = self._conn.execute(
+                "SELECT id, simhash FROM pairs WHERE user_id = ? AND account_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, account_id, PAIR_NEAR_DUP_WINDOW),
+            )
+            for row in recent:
+                if row["simhash"] is not None and hamming_distance(fingerprint, row["simhash"]) <= PAIR_NEAR_DUP_DISTANCE:
+                    return "near_duplicate", row["id"]
+
+        cursor = self._conn.execute(
+            "INSERT INTO pairs (user_id, account_id, draft, final, timestamp, content_hash, simhash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, account_id, draft, final, timestamp or datetime.utcnow().isoformat(), digest, fingerprint),
+        )
+        return "logged", cursor.lastrowid
+
+    def add_pair(self, user_id: str, account_id: str, draft: str, final: str, timestamp: str = None) -> tuple:
+        """Stores a pair unless it is a duplicate; returns (status, pair id), see add_pairs()"""
+        fingerprint = simhash(draft, final)
+        with self._lock, self._conn:
+            return self._insert_pair(user_id, account_id, draft, final, timestamp, fingerprint)
+
+    def add_pairs(self, pairs: list) -> list:
+        """
+        Stores (user_id, account_id, draft, final, timestamp) tuples,
+        committing every ADD_PAIRS_CHUNK pairs so a large batch doesn't hold
+        the store lock for seconds. Returns (status, pair id) per pair, in
+        order: "logged" with the new id, or "duplicate" / "near_duplicate"
+        with the id of the account's pair it duplicates (including earlier
+        pairs of the same call), in which case nothing was stored.
+        """
+        results = []
+        for start in range(0, len(pairs), ADD_PAIRS_CHUNK):
+            chunk = [(*pair, simhash(pair[2], pair[3])) for pair in pairs[start:start + ADD_PAIRS_CHUNK]]
+            with self._lock, self._conn:
+                results.extend(self._insert_pair(*pair) for pair in chunk)
+        return results
+
+    def count_pairs(self) -> int:
+        """Total number of pairs across all accounts"""
+        with self._lock:
+            row = self._conn.execute("SELECT count FROM pair_total WHERE id = 0").fetchone()
+        return row["count"]
+
+    def count_pairs_for_user(self, user_id: str, account_id: str) -> int:
+        """Number of pairs for a specific user/account"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT count FROM pair_counts WHERE user_id = ? AND account_id = ?",
+                (user_id, account_id),
+            ).fetchone()
+        return row["count"] if row else 0
+
+    def recent_accounts(self, limit: int) -> list:
+        """The (user_id, account_id) pairs that logged a pair most recently, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, account_id FROM pair_counts ORDER BY last_timestamp DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [(row["user_id"], row["account_id"]) for row in rows]
+
+    def get_pairs(self, user_id: str, account_id: str, after_id: int = 0) -> list:
+        """Pairs for a specific user/account with id above after_id (default: all), oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, draft, final, timestamp FROM pairs "
+                "WHERE user_id = ? AND account_id = ? AND id > ? ORDER BY id",
+                (user_id, account_id, after_id),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def last_pair_id(self, user_id: str, account_id: str) -> int:
+        """Id of the account's newest pair, or 0 if it has none"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(id) AS id FROM pairs WHERE user_id = ? AND account_id = ?",
+                (user_id, account_id),
+            ).fetchone()
+        return row["id"] or 0
+
+    def sample_pairs(self, user_id: str, account_id: str, max_id: int, limit: int,
+                     after_id: int = 0, half_life: int = 0) -> list:
+        """
+        Random sample of up to limit pairs for a user/account with id above
+        after_id and at most max_id, oldest first; all of them if there are
+        no more than limit or limit is None. With half_life, sampling is recency-weighted: a
+        pair's weight halves for every half_life newer pairs in the range.
+        """
+        with self._lock:
+            ids = [row["id"] for row in self._conn.execute(
+                "SELECT id FROM pairs WHERE user_id = ? AND account_id = ? AND id > ? AND id <= ? ORDER BY id DESC",
+                (user_id, account_id, after_id, max_id),
+            )]
+        if limit is not None and len(ids) > limit:
+            if half_life:
+                # Weighted sampling without replacement (Efraimidis-Spirakis) on a
+                # log scale, where the weight of the pair at rank r is 0.5 ** (r / half_life)
+                decay = math.log(2) / half_life
+                keys = [
+                    (math.log(max(random.expovariate(1.0), 1e-300)) + rank * decay, pair_id)
+                    for rank, pair_id in enumerate(ids)
+                ]
+                ids = [pair_id for _, pair_id in heapq.nsmallest(limit, keys)]
+            else:
+                ids = random.sample(ids, limit)
+
+        rows = []
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows += self._conn.execute(
+                    f"SELECT id, draft, final, timestamp FROM pairs WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+        return sorted((dict(row) for row in rows), key=lambda row: row["id"])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,15 @@
+# Instruction preamble shared by training examples and inference prompts.
+# It ends with a newline so tokenizers never merge it with the draft text,
+# which lets inference reuse its key/value cache across requests.
+PROMPT_PREFIX = (
+    "You are an email assistant. "
+    "You receive a draft email reply and should rewrite it to match the user's writing style.\n"
+    "IMPORTANT: Keep the exact meaning and content. Only change the style to match the user's preferences.\n\n"
+    "Draft reply:\n"
+)
+
+REVISED_MARKER = "Revised version:\n"
+
+def build_prompt(draft_text: str) -> str:
+    """Instruction prompt for revising a single draft"""
+    return PROMPT_PREFIX + f"{draft_text}\n\n" + REVISED_MARKER
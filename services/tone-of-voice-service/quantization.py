@@ -0,0 +1,102 @@
+import torch
+from torch import nn
+from peft.tuners.lora import LoraLayer
+
+
+class Int8DynamicLinear(nn.Module):
+    """
+    Frozen nn.Linear with int8 per-channel weights and dynamically
+    quantized activations, for CPU inference.
+
+    The packed weights are a plain attribute rather than a parameter or
+    submodule, and there is no `weight` attribute: peft then doesn't try to
+    cast adapter weights to its dtype, so adapters can still be attached to
+    an already quantized model. In a state_dict the layer appears as plain
+    tensors (weight_int8, weight_scales and bias), so a quantized model can
+    be saved as safetensors and loaded without pickle.
+    """
+
+    def __init__(self, linear: nn.Linear = None, in_features: int = None, out_features: int = None,
+                 bias: bool = True):
+        """Quantizes linear, or without it makes an empty layer to load a state_dict into"""
+        super().__init__()
+        self.in_features = linear.in_features if linear is not None else in_features
+        self.out_features = linear.out_features if linear is not None else out_features
+        self.has_bias = linear.bias is not None if linear is not None else bias
+        self._packed_params = None
+        if linear is not None:
+            weight = linear.weight.detach().float()
+            scales = (weight.abs().amax(dim=1) / 127).clamp(min=1e-8)
+            zero_points = torch.zeros(self.out_features, dtype=torch.long)
+            qweight = torch.quantize_per_channel(weight, scales.double(), zero_points, 0, torch.qint8)
+            bias = linear.bias.detach().float() if linear.bias is not None else None
+            self._packed_params = torch.ops.quantized.linear_prepack(qweight, bias)
+
+    def forward(self, x):
+        return torch.ops.quantized.linear_dynamic(x.float(), self._packed_params, reduce_range=True)
+
+    def nbytes(self) -> int:
+        nbytes = self.in_features * self.out_features + 8 * self.out_features  # Per-channel scales
+        if self.has_bias:
+            nbytes += 4 * self.out_features
+        return nbytes
+
+    def _save_to_state_dict(self, destination, prefix, keep_vars):
+        qweight, bias = torch.ops.quantized.linear_unpack(self._packed_params)
+        destination[prefix + "weight_int8"] = qweight.int_repr()
+        destination[prefix + "weight_scales"] = qweight.q_per_channel_scales()
+        if bias is not None:
+            destination[prefix + "bias"] = bias
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict, missing_keys,
+                              unexpected_keys, error_msgs):
+        keys = [prefix + "weight_int8", prefix + "weight_scales"] + ([prefix + "bias"] if self.has_bias else [])
+        missing = [key for key in keys if key not in state_dict]
+        if missing:
+            # e.g. peft loading adapter weights into the whole model
+            missing_keys.extend(missing)
+            return
+        weight_int8, scales = state_dict[keys[0]], state_dict[keys[1]]
+        zero_points = torch.zeros(self.out_features, dtype=torch.long)
+        qweight = torch._make_per_channel_quantized_tensor(weight_int8, scales.double(), zero_points, 0)
+        bias = state_dict[keys[2]].float() if self.has_bias else None
+        self._packed_params = torch.ops.quantized.linear_prepack(qweight, bias)
+
+
+def quantize_lora_base_layers(model):
+    """
+    Replaces the frozen base weights inside every LoRA-wrapped layer with
+    Int8DynamicLinear and casts everything else (embeddings, norms, lm_head,
+    adapters) to fp32. Later adapters must target the same modules, since
+    peft cannot wrap an already quantized layer.
+    """
+    for module in list(model.modules()):
+        if isinstance(module, LoraLayer) and isinstance(module.base_layer, nn.Linear):
+            module.base_layer = Int8DynamicLinear(module.base_layer)
+    return model.float()
+
+
+def quantize_linear_layers(model, skip=("lm_head",), empty: bool = False):
+    """
+    Replaces every nn.Linear except those named in skip with Int8DynamicLinear;
+    with empty=True with empty ones, e.g. in a model built on the meta device
+    that a saved state_dict is loaded into
+    """
+    for module in list(model.modules()):
+        for child_name, child in list(module.named_children()):
+            if isinstance(child, nn.Linear) and child_name not in skip:
+                if empty:
+                    layer = Int8DynamicLinear(
+                        in_features=child.in_features, out_features=child.out_features, bias=child.bias is not None
+                    )
+                else:
+                    layer = Int8DynamicLinear(child)
+                setattr(module, child_name, layer)
+    return model.float()
+
+
+def module_nbytes(model) -> int:
+    """Memory held by a model's parameters, including int8-quantized weights"""
+    nbytes = sum(param.numel() * param.element_size() for param in model.parameters())
+    nbytes += sum(module.nbytes() for module in model.modules() if isinstance(module, Int8DynamicLinear))
+    return nbytes
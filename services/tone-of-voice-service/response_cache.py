@@ -0,0 +1,90 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_draft(draft_text: str) -> str:
+    """Draft text as it is compared for caching: line endings, trailing spaces and outer blank lines don't count"""
+    lines = draft_text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def response_key(account_key: str, version: str, draft_text: str, params: str) -> tuple:
+    """Cache key of a revision: the account, its adapter version, the draft and the generation settings"""
+    digest = hashlib.sha256(f"{params}\0{normalize_draft(draft_text)}".encode("utf-8")).hexdigest()
+    return (account_key, version, digest)
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of finished revisions with a time-to-live.
+
+    Keys come from response_key(); as they include the adapter version, a
+    retrained adapter never serves revisions of the previous one, and
+    invalidate(account_key) drops the stale entries right away. Each entry
+    remembers how long its generation took, so hits add up the time saved.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.seconds_saved = 0.0
+
+    def get(self, key: tuple):
+        """Returns the cached (revised, generation_seconds), or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry["stored_at"] > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.seconds_saved += entry["generation_seconds"]
+            self._entries.move_to_end(key)
+            return entry["revised"], entry["generation_seconds"]
+
+    def put(self, key: tuple, revised: str, generation_seconds: float):
+        with self._lock:
+            self._entries[key] = {
+                "revised": revised,
+                "generation_seconds": generation_seconds,
+                "stored_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, account_key: str) -> int:
+        """Drops every cached revision of an account"""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == account_key]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "generation_seconds_saved": round(self.seconds_saved, 1),
+            }
@@ -0,0 +1,84 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of values (0 for an empty sequence)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class RevisionBatcher:
+    """
+    Collects concurrent revise requests into micro-batches.
+
+    Requests are grouped by key (the adapter they need). The first request of
+    a group opens a batching window of window_ms; the group is flushed when
+    the window closes or max_batch_size requests have arrived, whichever
+    comes first. run_batch(key, items) is awaited with the collected items
+    and must return one result per item, in order.
+    """
+
+    def __init__(self, run_batch, window_ms: float, max_batch_size: int, latency_samples: int = 1000):
+        self.run_batch = run_batch
+        self.window = window_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending = {}  # {key: [(item, future, enqueued_at)]}
+        self._timers = {}
+        self._latencies = deque(maxlen=latency_samples)
+        self.requests = 0
+        self.batches = 0
+
+    async def submit(self, key: str, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        group = self._pending.setdefault(key, [])
+        group.append((item, future, time.perf_counter()))
+        self.requests += 1
+
+        if len(group) >= self.max_batch_size or self.window <= 0:
+            self._flush_now(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window, self._flush_now, key)
+        return await future
+
+    def _flush_now(self, key: str):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        group = self._pending.pop(key, None)
+        if group:
+            asyncio.ensure_future(self._run(key, group))
+
+    async def _run(self, key: str, group: list):
+        self.batches += 1
+        try:
+            results = await self.run_batch(key, [item for item, _, _ in group])
+        except Exception as e:
+            for _, future, _ in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        finished = time.perf_counter()
+        for (_, future, enqueued_at), result in zip(group, results):
+            self._latencies.append(finished - enqueued_at)
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        latencies = list(self._latencies)
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "latency_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "latency_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        }
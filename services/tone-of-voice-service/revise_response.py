@@ -1,87 +1,406 @@
+import os
+import threading
+import time
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from accelerate import init_empty_weights
+from safetensors.torch import load_file, save_file
+from transformers import (
+    AutoConfig,
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    BitsAndBytesConfig,
+    LogitsProcessor,
+    LogitsProcessorList,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextStreamer,
+)
 from peft import PeftModel
 from pathlib import Path
+from prompts import PROMPT_PREFIX, build_prompt
+from generation_config import BASE_MODEL_NAME, INFERENCE_PRECISION, GENERATION_SETTINGS
+from metrics import REVISE_STAGE_SECONDS, REVISE_GENERATED_TOKENS, ASSISTED_DECODING_TOKENS
+from assisted_decoding import assisted_generate
+from mmap_weights import load_model_mmap
+from quantization import module_nbytes, quantize_linear_layers, quantize_lora_base_layers
 
-BASE_MODEL_NAME = "mistralai/Mistral-7B-Instruct-v0.2"
+MERGED_ARTIFACT_NAME = "merged_int8.safetensors"
 
-def load_model_and_tokenizer(adapter_path: str):
+# On CPU with auto or bf16 precision, map the base weights from the local
+# safetensors snapshot instead of copying them into process memory, so all
+# inference worker processes share one copy through the page cache. The
+# model then runs in the dtype the snapshot was saved in.
+BASE_WEIGHTS_MMAP = os.getenv("BASE_WEIGHTS_MMAP", "0") == "1"
+
+# Common email closing phrases
+CLOSING_PHRASES = [
+    "Freundliche Grüße", "Freundliche Grüsse",
+    "Mit freundlichen Grüßen", "Mit freundlichen Grüssen",
+    "Beste Grüße", "Beste Grüsse",
+    "Viele Grüße", "Viele Grüsse",
+    "Herzliche Grüße", "Herzliche Grüsse",
+    "Best regards", "Kind regards", "Regards"
+]
+
+# Error phrases that indicate hallucinations
+ERROR_PHRASES = [
+    "Original:", "Draft reply:", "Assistant:",
+    "Ursprünglicher Text:", "Erweiterte Übersetzung:"
+]
+
+# Signature lines kept after a closing phrase, and the length above which a line is no longer a signature
+MAX_SIGNATURE_LINES = 2
+MAX_SIGNATURE_LINE_LENGTH = 50
+
+# One base model per process; per-user LoRA adapters are attached to it by name
+_base_model = None
+_peft_model = None
+_tokenizer = None
+_merged_models = {}  # {adapter_name: model}, int8-merged mode only
+# Guards adapter attach/switch and generation, since the active adapter is global model state
+_model_lock = threading.RLock()
+# Adapters evicted by the cache, detached by unload_pending() on an inference thread
+_pending_unloads = set()
+_pending_lock = threading.Lock()
+
+# Key/value cache of the instruction preamble, computed once per adapter
+PREFIX_CACHE_ENABLED = os.getenv("PREFIX_CACHE_ENABLED", "1") != "0"
+_prefix_cache = {}  # {adapter_name: (prefix_ids, past_key_values)}
+
+# Decoding of single-draft generations: "off" (plain generate()) or
+# "prompt-lookup" (assisted decoding with candidate tokens copied from the prompt).
+# Batches of several drafts always use plain batched generation.
+ASSISTED_DECODING = os.getenv("ASSISTED_DECODING", "off")
+PROMPT_LOOKUP_MAX_NGRAM = int(os.getenv("PROMPT_LOOKUP_MAX_NGRAM", 3))
+PROMPT_LOOKUP_NUM_TOKENS = int(os.getenv("PROMPT_LOOKUP_NUM_TOKENS", 10))
+
+def load_tokenizer():
+    """Loads the base model's tokenizer once per process"""
+    global _tokenizer
+    with _model_lock:
+        if _tokenizer is None:
+            tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL_NAME)
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            _tokenizer = tokenizer
+        return _tokenizer
+
+def base_model_kwargs() -> dict:
+    """from_pretrained arguments for the base model under INFERENCE_PRECISION"""
+    cuda = torch.cuda.is_available()
+    kwargs = {"device_map": "auto" if cuda else "cpu", "low_cpu_mem_usage": True}
+    if INFERENCE_PRECISION == "int8" and cuda:
+        kwargs["quantization_config"] = BitsAndBytesConfig(load_in_8bit=True)
+    elif INFERENCE_PRECISION in ("bf16", "int8", "int8-merged"):
+        # CPU int8 quantizes layer by layer from bf16, so fp32 weights are never all in memory
+        kwargs["torch_dtype"] = torch.bfloat16
+    else:
+        kwargs["torch_dtype"] = torch.float16 if cuda else torch.float32
+    return kwargs
+
+def load_base_model():
     """
-    Loads:
-    - Base Mistral model
-    - LoRA adapter from adapter_path
-    - Tokenizer
+    Loads the shared base Mistral model and tokenizer once per process.
     """
-    print(f"Loading model from {adapter_path}")
-    
-    # Load tokenizer
-    tokenizer = AutoTokenizer.from_pretrained(adapter_path)
-    if tokenizer.pad_token is None:
-        tokenizer.pad_token = tokenizer.eos_token
+    global _base_model
+    with _model_lock:
+        tokenizer = load_tokenizer()
+        if _base_model is None:
+            if BASE_WEIGHTS_MMAP and INFERENCE_PRECISION in ("auto", "bf16") and not torch.cuda.is_available():
+                print(f"Mapping base model: {BASE_MODEL_NAME}")
+                _base_model = load_model_mmap(BASE_MODEL_NAME)
+                if INFERENCE_PRECISION == "bf16" and _base_model.dtype != torch.bfloat16:
+                    print(f"Snapshot is {_base_model.dtype}; converting to bf16 copies the weights")
+                    _base_model = _base_model.to(torch.bfloat16)
+            else:
+                print(f"Loading base model: {BASE_MODEL_NAME} ({INFERENCE_PRECISION})")
+                _base_model = AutoModelForCausalLM.from_pretrained(BASE_MODEL_NAME, **base_model_kwargs())
+            _base_model.eval()
+        return _base_model, tokenizer
 
-    # Load base Mistral model
+def load_adapter(adapter_name: str, adapter_path: str):
+    """
+    Attaches the LoRA adapter at adapter_path to the shared base model under
+    adapter_name. Only the adapter weights are read from disk; the base model
+    is loaded on first use and then reused.
+    """
+    global _peft_model
+    if INFERENCE_PRECISION == "int8-merged":
+        return load_merged_model(adapter_name, adapter_path)
+    with _model_lock:
+        # Evicted and requested again before it was detached: keep it
+        with _pending_lock:
+            _pending_unloads.discard(adapter_name)
+        base_model, tokenizer = load_base_model()
+        if _peft_model is None:
+            print(f"Loading adapter {adapter_name} from {adapter_path}")
+            _peft_model = PeftModel.from_pretrained(
+                base_model,
+                adapter_path,
+                adapter_name=adapter_name,
+                is_trainable=False,  # Only inference
+            )
+            if INFERENCE_PRECISION == "int8" and not torch.cuda.is_available():
+                quantize_lora_base_layers(_peft_model)
+            _peft_model.eval()
+        elif adapter_name not in _peft_model.peft_config:
+            print(f"Loading adapter {adapter_name} from {adapter_path}")
+            _peft_model.load_adapter(adapter_path, adapter_name=adapter_name, is_trainable=False)
+        return _peft_model, tokenizer
+
+def export_merged_model(adapter_path: str):
+    """
+    Merges the adapter into a copy of the base model, quantizes its linear
+    layers to int8 and saves the weights next to the adapter as
+    MERGED_ARTIFACT_NAME. Takes minutes for a 7B model, so it runs in the
+    training job that produced the adapter, never on the request path.
+    """
+    print(f"Exporting merged int8 model for {adapter_path}")
     base_model = AutoModelForCausalLM.from_pretrained(
-        BASE_MODEL_NAME,
-        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-        device_map="auto" if torch.cuda.is_available() else "cpu",
-        low_cpu_mem_usage=True,
+        BASE_MODEL_NAME, torch_dtype=torch.bfloat16, low_cpu_mem_usage=True
     )
+    model = PeftModel.from_pretrained(base_model, adapter_path).merge_and_unload()
+    quantize_linear_layers(model)
+    state_dict = model.state_dict()
+    if model.config.tie_word_embeddings:
+        state_dict.pop("lm_head.weight", None)
+    artifact_path = Path(adapter_path) / MERGED_ARTIFACT_NAME
+    temp_path = artifact_path.with_name(artifact_path.name + ".tmp")
+    save_file({name: tensor.contiguous() for name, tensor in state_dict.items()}, str(temp_path))
+    os.replace(temp_path, artifact_path)
 
-    # Load LoRA adapter
-    model = PeftModel.from_pretrained(
-        base_model,
-        adapter_path,
-        is_trainable=False,  # Only inference
-    )
+def merged_model_skeleton():
+    """The base model's architecture with int8 layers and meta-device weights, for loading a merged model into"""
+    config = AutoConfig.from_pretrained(BASE_MODEL_NAME)
+    # Buffers (e.g. rotary embeddings) are computed at init and stay real
+    with init_empty_weights(include_buffers=False):
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=torch.float32)
+    return quantize_linear_layers(model, empty=True)
+
+def merged_model_nbytes() -> int:
+    """Memory one merged int8 model takes, computed without loading any weights"""
+    return module_nbytes(merged_model_skeleton())
 
+def load_merged_model(adapter_name: str, adapter_path: str):
+    """
+    Loads the account's merged int8 model (int8-merged mode), exported by
+    the training job that produced the adapter.
+    """
+    with _model_lock:
+        with _pending_lock:
+            _pending_unloads.discard(adapter_name)
+        if adapter_name in _merged_models:
+            return _merged_models[adapter_name], load_tokenizer()
+
+    artifact_path = Path(adapter_path) / MERGED_ARTIFACT_NAME
+    if not artifact_path.exists():
+        raise FileNotFoundError(
+            f"No merged int8 model in {adapter_path}; export it with "
+            "python train_tone_of_voice.py <user_id> <account_id> --export-merged"
+        )
+    # Each merged model is separate, so loading doesn't hold up other accounts' generations
+    print(f"Loading merged model {adapter_name} from {artifact_path}")
+    model = merged_model_skeleton()
+    model.load_state_dict(load_file(str(artifact_path)), strict=False, assign=True)
+    if model.config.tie_word_embeddings:
+        model.tie_weights()
+    missing = [name for name, param in model.named_parameters() if param.is_meta]
+    if missing:
+        raise ValueError(f"Weights missing from {artifact_path}: {', '.join(missing[:5])}")
     model.eval()
-    return model, tokenizer
+    with _model_lock:
+        model = _merged_models.setdefault(adapter_name, model)
+        return model, load_tokenizer()
 
-def rewrite_draft(draft_text: str, model, tokenizer) -> str:
+def unload_adapter(adapter_name: str):
+    """Detaches an adapter from the shared base model and frees its weights"""
+    with _model_lock:
+        _prefix_cache.pop(adapter_name, None)
+        if _merged_models.pop(adapter_name, None) is not None:
+            return
+        if _peft_model is None or adapter_name not in _peft_model.peft_config:
+            return
+        _peft_model.base_model.delete_adapter(adapter_name)
+
+def schedule_unload(adapter_name: str):
     """
-    Takes a draft reply and returns a revised version
-    in the learned style.
-    """
-    prompt = (
-        "You are an email assistant. "
-        "You receive a draft email reply and should rewrite it to match the user's writing style.\n"
-        "IMPORTANT: Keep the exact meaning and content. Only change the style to match the user's preferences.\n\n"
-        "Draft reply:\n"
-        f"{draft_text}\n\n"
-        "Revised version:\n"
-    )
+    Marks an adapter for unload_pending() without waiting for _model_lock,
+    which a generation may hold for seconds (e.g. from the event loop)
+    """
+    with _pending_lock:
+        _pending_unloads.add(adapter_name)
 
-    inputs = tokenizer(prompt, return_tensors="pt")
-    
-    # Move inputs to correct device
+def unload_pending():
+    """Detaches the adapters marked by schedule_unload() that weren't loaded again since"""
+    with _model_lock:
+        with _pending_lock:
+            adapter_names = list(_pending_unloads)
+            _pending_unloads.clear()
+        for adapter_name in adapter_names:
+            unload_adapter(adapter_name)
+
+def activate_adapter(model, adapter_name: str):
+    """Makes adapter_name the active adapter of the shared model (merged models have none)"""
+    if adapter_name is not None and isinstance(model, PeftModel):
+        model.set_adapter(adapter_name)
+
+def adapter_nbytes(model, adapter_name: str) -> int:
+    """Memory held by one adapter's LoRA weights (or by the whole merged model)"""
+    if not isinstance(model, PeftModel):
+        return module_nbytes(model)
+    # Adapters are attached and deleted under the lock, which changes the parameters
+    with _model_lock:
+        return sum(
+            param.numel() * param.element_size()
+            for name, param in model.named_parameters()
+            if "lora_" in name and f".{adapter_name}." in name
+        )
+
+def load_model_and_tokenizer(adapter_path: str):
+    """
+    Loads:
+    - Base Mistral model (shared, loaded once)
+    - LoRA adapter from adapter_path, named after its directory
+    - Tokenizer
+    """
+    return load_adapter(Path(adapter_path).name, adapter_path)
+
+def get_prefix_cache(model, tokenizer, adapter_name: str = None):
+    """
+    Returns (prefix_ids, past_key_values) for PROMPT_PREFIX under the active
+    adapter, running the prefill once and reusing it afterwards. The LoRA
+    weights change the attention keys/values, so the cache is per adapter.
+    Must be called with _model_lock held and the adapter already active.
+    """
+    key = adapter_name or getattr(model, "active_adapter", None)
+    if key not in _prefix_cache:
+        device = next(model.parameters()).device
+        prefix_ids = tokenizer(PROMPT_PREFIX)["input_ids"]
+        with torch.no_grad():
+            outputs = model(input_ids=torch.tensor([prefix_ids], device=device), use_cache=True)
+        past_key_values = outputs.past_key_values
+        if hasattr(past_key_values, "to_legacy_cache"):
+            past_key_values = past_key_values.to_legacy_cache()
+        _prefix_cache[key] = (prefix_ids, past_key_values)
+    return _prefix_cache[key]
+
+def prepare_inputs(prompts: list, model, tokenizer, adapter_name: str = None) -> dict:
+    """
+    Tokenizes prompts into generate() inputs.
+
+    With the prefix cache, the cached preamble keys/values are passed as
+    past_key_values so prefill only covers each prompt's draft part. The
+    batch is laid out as [preamble][padding][draft part]; padding is masked
+    out and position ids follow the attention mask, so every sequence sees
+    exactly the positions it would without the cache.
+    """
     device = next(model.parameters()).device
-    inputs = {k: v.to(device) for k, v in inputs.items()}
+    if PREFIX_CACHE_ENABLED:
+        prefix_ids, past_key_values = get_prefix_cache(model, tokenizer, adapter_name)
+        prefix_length = len(prefix_ids)
+        encoded = [tokenizer(prompt)["input_ids"] for prompt in prompts]
+        # Only valid if the joint tokenization keeps the preamble tokens intact
+        if all(ids[:prefix_length] == prefix_ids and len(ids) > prefix_length for ids in encoded):
+            rests = [ids[prefix_length:] for ids in encoded]
+            width = max(len(rest) for rest in rests)
+            input_ids = [
+                prefix_ids + [tokenizer.pad_token_id] * (width - len(rest)) + rest for rest in rests
+            ]
+            attention_mask = [
+                [1] * prefix_length + [0] * (width - len(rest)) + [1] * len(rest) for rest in rests
+            ]
+            batch_size = len(prompts)
+            return {
+                "input_ids": torch.tensor(input_ids, device=device),
+                "attention_mask": torch.tensor(attention_mask, device=device),
+                "past_key_values": tuple(
+                    tuple(state.expand(batch_size, -1, -1, -1) for state in layer)
+                    for layer in past_key_values
+                ),
+            }
 
+    tokenizer.padding_side = "left"
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True)
+    return {k: v.to(device) for k, v in inputs.items()}
+
+def rewrite_draft(draft_text: str, model, tokenizer, adapter_name: str = None) -> str:
+    """
+    Takes a draft reply and returns a revised version
+    in the learned style. If adapter_name is given, that adapter is
+    activated on the shared model for this generation.
+    """
+    return rewrite_drafts([draft_text], model, tokenizer, adapter_name=adapter_name)[0]
+
+def rewrite_drafts(draft_texts: list, model, tokenizer, adapter_name: str = None) -> list:
+    """
+    Revises several drafts with the same adapter in one batched generate
+    call. Prompts are left-padded so every sequence continues right after
+    its own "Revised version:" marker.
+    """
+    prompts = [build_prompt(draft_text) for draft_text in draft_texts]
+    outputs, _ = generate_revisions(prompts, model, tokenizer, adapter_name=adapter_name)
+    with REVISE_STAGE_SECONDS.labels("cleanup").time():
+        return [
+            clean_revision(tokenizer.decode(output, skip_special_tokens=True), prompt)
+            for output, prompt in zip(outputs, prompts)
+        ]
+
+def generate_revisions(prompts: list, model, tokenizer, adapter_name: str = None, stop_early: bool = True):
+    """
+    Runs the batched generation for prompts and returns (output_ids,
+    prompt_length). With stop_early, each sequence stops as soon as the
+    clean_revision rules would discard everything after it.
+    """
     # EOS token for stopping
     eos_token_id = tokenizer.eos_token_id
     if eos_token_id is None:
         eos_token_id = tokenizer.pad_token_id
-    
-    # Stop strings to prevent hallucinations
-    stop_strings = ["\n\nDraft reply:", "\n\nOriginal:", "Assistant:", "Best regards"]
-
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=300,
-            min_length=30,
-            do_sample=True,
-            temperature=0.3,  # Low temperature for consistency
-            top_p=0.75,
-            top_k=25,
-            repetition_penalty=1.35,  # Higher to prevent repetition
-            pad_token_id=eos_token_id,
-            eos_token_id=eos_token_id,
-            no_repeat_ngram_size=3,
-        )
 
-    full_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    with _model_lock, torch.no_grad():
+        activate_adapter(model, adapter_name)
+        with REVISE_STAGE_SECONDS.labels("tokenize").time():
+            inputs = prepare_inputs(prompts, model, tokenizer, adapter_name)
+        prompt_length = inputs["input_ids"].shape[1]
+        timer = GenerationTimer()
+        processors = [timer]
+        stopping = {}
+        if stop_early:
+            criteria = RevisionStoppingCriteria(tokenizer, prompt_length, len(prompts), eos_token_id)
+            stopping = {"stopping_criteria": StoppingCriteriaList([criteria])}
+            processors.append(FinishedSequencesProcessor(criteria))
+        if ASSISTED_DECODING == "prompt-lookup" and len(prompts) == 1:
+            outputs, stats = assisted_generate(
+                model,
+                inputs["input_ids"],
+                GENERATION_SETTINGS,
+                eos_token_id,
+                past_key_values=inputs.get("past_key_values"),
+                logits_processor=processors,
+                stopping_criteria=stopping.get("stopping_criteria"),
+                max_ngram=PROMPT_LOOKUP_MAX_NGRAM,
+                num_candidates=PROMPT_LOOKUP_NUM_TOKENS,
+            )
+            ASSISTED_DECODING_TOKENS.labels("proposed").inc(stats["proposed"])
+            ASSISTED_DECODING_TOKENS.labels("accepted").inc(stats["accepted"])
+        else:
+            outputs = model.generate(
+                **inputs,
+                **GENERATION_SETTINGS,
+                **stopping,
+                logits_processor=LogitsProcessorList(processors),
+                pad_token_id=eos_token_id,
+                eos_token_id=eos_token_id,
+            )
+        timer.observe()
+    for generated in (outputs[:, prompt_length:] != eos_token_id).sum(dim=1).tolist():
+        REVISE_GENERATED_TOKENS.observe(generated)
+    return outputs, prompt_length
 
+def clean_revision(full_text: str, prompt: str) -> str:
+    """
+    Extracts the revised reply from the decoded prompt + generation and
+    strips hallucinated continuations after the signature.
+    """
     # Extract only the part after "Revised version:"
     if "Revised version:" in full_text:
         result = full_text.split("Revised version:")[-1].strip()
@@ -93,45 +412,29 @@ def rewrite_draft(draft_text: str, model, tokenizer) -> str:
     lines = result.split('\n')
     cleaned_lines = []
     
-    # Common email closing phrases
-    closing_phrases = [
-        "Freundliche Grüße", "Freundliche Grüsse",
-        "Mit freundlichen Grüßen", "Mit freundlichen Grüssen",
-        "Beste Grüße", "Beste Grüsse",
-        "Viele Grüße", "Viele Grüsse",
-        "Herzliche Grüße", "Herzliche Grüsse",
-        "Best regards", "Kind regards", "Regards"
-    ]
-    
-    # Error phrases that indicate hallucinations
-    error_phrases = [
-        "Original:", "Draft reply:", "Assistant:",
-        "Ursprünglicher Text:", "Erweiterte Übersetzung:"
-    ]
-    
     found_closing = False
     
     for i, line in enumerate(lines):
         line = line.strip()
         
         # Stop at error phrases
-        if any(error_phrase in line for error_phrase in error_phrases):
+        if any(error_phrase in line for error_phrase in ERROR_PHRASES):
             break
         
         # Check if this is a closing phrase
-        is_closing = any(closing in line for closing in closing_phrases)
+        is_closing = any(closing in line for closing in CLOSING_PHRASES)
         
         if is_closing:
             cleaned_lines.append(line)
             found_closing = True
             
             # Next 1-2 lines might be name/signature
-            for j in range(i + 1, min(i + 3, len(lines))):
+            for j in range(i + 1, min(i + 1 + MAX_SIGNATURE_LINES, len(lines))):
                 next_line = lines[j].strip()
                 if not next_line:
                     break
                 # Short line after closing = probably name/email
-                if len(next_line) < 50 and not any(bad in next_line for bad in error_phrases):
+                if len(next_line) < MAX_SIGNATURE_LINE_LENGTH and not any(bad in next_line for bad in ERROR_PHRASES):
                     cleaned_lines.append(next_line)
                 else:
                     break
@@ -141,7 +444,7 @@ def rewrite_draft(draft_text: str, model, tokenizer) -> str:
         if not line and len(cleaned_lines) > 5:
             if i + 1 < len(lines):
                 next_line = lines[i + 1].strip()
-                if any(error_phrase in next_line for error_phrase in error_phrases):
+                if any(error_phrase in next_line for error_phrase in ERROR_PHRASES):
                     break
             continue
         
@@ -152,7 +455,7 @@ def rewrite_draft(draft_text: str, model, tokenizer) -> str:
     
     # Remove hallucinations after signature
     if found_closing:
-        for closing in closing_phrases:
+        for closing in CLOSING_PHRASES:
             if closing in result_text:
                 closing_index = result_text.rfind(closing)
                 potential_end = result_text.find("\n", closing_index)
@@ -171,6 +474,172 @@ def rewrite_draft(draft_text: str, model, tokenizer) -> str:
     
     return result_text
 
+def find_cutoff(text: str):
+    """
+    Applies the clean_revision stop rules incrementally to generated text.
+    Returns the index where the revision ends (at a line with an error
+    phrase, or after the signature lines following a closing phrase), or
+    None while generation should continue.
+    """
+    pos = 0
+    found_closing = False
+    signature_lines = 0
+    while True:
+        newline = text.find("\n", pos)
+        complete = newline != -1
+        line = text[pos:newline] if complete else text[pos:]
+        stripped = line.strip()
+
+        if any(error_phrase in line for error_phrase in ERROR_PHRASES):
+            return pos
+
+        if found_closing:
+            too_long = len(stripped) >= MAX_SIGNATURE_LINE_LENGTH
+            if not complete and not too_long:
+                return None  # Can't tell yet whether this is a signature line
+            if not stripped or too_long:
+                return pos
+            signature_lines += 1
+            if signature_lines == MAX_SIGNATURE_LINES:
+                return newline
+        elif complete and any(closing in stripped for closing in CLOSING_PHRASES):
+            found_closing = True
+
+        if not complete:
+            return None
+        pos = newline + 1
+
+class RevisionStoppingCriteria(StoppingCriteria):
+    """
+    Tracks, per sequence, whether find_cutoff has found the end of the
+    revision, and stops generation once every sequence is done or
+    stop_event is set (e.g. the client went away). Sequences that finish
+    early are forced to EOS by FinishedSequencesProcessor, so the rest of
+    the batch keeps generating without them.
+    """
+
+    def __init__(self, tokenizer, prompt_length: int, batch_size: int, eos_token_id: int,
+                 stop_event: threading.Event = None):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.eos_token_id = eos_token_id
+        self.stop_event = stop_event
+        self.done = [False] * batch_size
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        if self.stop_event is not None and self.stop_event.is_set():
+            return True
+        for i, done in enumerate(self.done):
+            if done:
+                continue
+            generated_ids = input_ids[i, self.prompt_length:]
+            if generated_ids.numel() and generated_ids[-1].item() == self.eos_token_id:
+                self.done[i] = True
+                continue
+            generated = self.tokenizer.decode(generated_ids, skip_special_tokens=True)
+            self.done[i] = find_cutoff(generated.lstrip()) is not None
+        return all(self.done)
+
+class FinishedSequencesProcessor(LogitsProcessor):
+    """Forces EOS for sequences RevisionStoppingCriteria has marked done"""
+
+    def __init__(self, criteria: RevisionStoppingCriteria):
+        self.criteria = criteria
+
+    def __call__(self, input_ids, scores):
+        for i, done in enumerate(self.criteria.done):
+            if done:
+                scores[i, :] = -float("inf")
+                scores[i, self.criteria.eos_token_id] = 0
+        return scores
+
+class GenerationTimer(LogitsProcessor):
+    """
+    Records prefill and decode time of one generate() call. Logits
+    processors first run after the prompt forward pass, so the first call
+    marks the end of prefill. Scores are left unchanged.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token = None
+
+    def __call__(self, input_ids, scores):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        return scores
+
+    def observe(self):
+        end = time.perf_counter()
+        first_token = self.first_token or end
+        REVISE_STAGE_SECONDS.labels("prefill").observe(first_token - self.start)
+        REVISE_STAGE_SECONDS.labels("decode").observe(end - first_token)
+
+class _CallbackStreamer(TextStreamer):
+    """TextStreamer that hands finalized text to a callback instead of printing it"""
+
+    def __init__(self, tokenizer, on_text):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.on_text = on_text
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self.on_text(text)
+
+def stream_draft(draft_text: str, model, tokenizer, on_text, adapter_name: str = None,
+                 stop_event: threading.Event = None) -> str:
+    """
+    Revises a draft like rewrite_draft, calling on_text(chunk) with the
+    revision as it is generated. Chunks are trimmed with find_cutoff, and a
+    short tail is held back so a partially generated error phrase is never
+    sent. Generation stops as soon as the revision is complete. Returns the
+    final text after clean_revision, which callers should treat as
+    authoritative.
+    """
+    prompt = build_prompt(draft_text)
+
+    eos_token_id = tokenizer.eos_token_id
+    if eos_token_id is None:
+        eos_token_id = tokenizer.pad_token_id
+
+    holdback = max(len(phrase) for phrase in ERROR_PHRASES) - 1
+    generated = []
+    sent = 0
+
+    def on_generated_text(chunk: str):
+        nonlocal sent
+        generated.append(chunk)
+        text = "".join(generated).lstrip()
+        cutoff = find_cutoff(text)
+        end = cutoff if cutoff is not None else max(sent, len(text) - holdback)
+        if end > sent:
+            on_text(text[sent:end])
+            sent = end
+
+    streamer = _CallbackStreamer(tokenizer, on_generated_text)
+
+    with _model_lock, torch.no_grad():
+        activate_adapter(model, adapter_name)
+        with REVISE_STAGE_SECONDS.labels("tokenize").time():
+            inputs = prepare_inputs([prompt], model, tokenizer, adapter_name)
+        prompt_length = inputs["input_ids"].shape[1]
+        criteria = RevisionStoppingCriteria(tokenizer, prompt_length, 1, eos_token_id, stop_event)
+        timer = GenerationTimer()
+        outputs = model.generate(
+            **inputs,
+            **GENERATION_SETTINGS,
+            pad_token_id=eos_token_id,
+            eos_token_id=eos_token_id,
+            streamer=streamer,
+            stopping_criteria=StoppingCriteriaList([criteria]),
+            logits_processor=LogitsProcessorList([timer]),
+        )
+        timer.observe()
+
+    REVISE_GENERATED_TOKENS.observe(int((outputs[0, prompt_length:] != eos_token_id).sum()))
+    with REVISE_STAGE_SECONDS.labels("cleanup").time():
+        return clean_revision(tokenizer.decode(outputs[0], skip_special_tokens=True), prompt)
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) < 2:
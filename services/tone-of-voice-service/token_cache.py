@@ -0,0 +1,130 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+
+TOKEN_CACHE_PATH = Path("data/token_cache.db")
+
+# Entries an account's training runs haven't used in this many of its runs are dropped
+TOKEN_CACHE_KEEP_RUNS = int(os.getenv("TOKEN_CACHE_KEEP_RUNS", 10))
+
+# Version of the schema after _migrate_schema(), kept in PRAGMA user_version
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokenized_examples (
+    key TEXT PRIMARY KEY,
+    input_ids BLOB NOT NULL,
+    prompt_length INTEGER NOT NULL
+);
+"""
+
+
+def example_key(tokenizer_name: str, max_length: int, text: str) -> str:
+    """Content hash of a formatted training example and how it is tokenized"""
+    return hashlib.sha256(f"{tokenizer_name}\0{max_length}\0{text}".encode("utf-8")).hexdigest()
+
+
+class TokenCache:
+    """
+    Tokenized training examples in SQLite, keyed by example_key().
+
+    Each entry holds the input ids and the prompt length, which is all that
+    is needed to rebuild the attention mask and the prompt-masked labels, so
+    a retrain only tokenizes pairs it has not seen before.
+
+    Entries belong to the account whose run last used them. Every training
+    run numbers itself with start_run() and marks the entries it reads or
+    writes with that number; prune() then drops the account's entries that
+    none of its last TOKEN_CACHE_KEEP_RUNS runs used, such as deduplicated
+    pairs or replay samples not drawn again.
+    """
+
+    def __init__(self, db_path: Path = TOKEN_CACHE_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate_schema()
+
+    def _migrate_schema(self):
+        """Brings the database up to SCHEMA_VERSION, one version at a time"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+                if version < 1:
+                    # Entries owned by accounts and runs; the unowned ones could never be pruned
+                    self._conn.execute("DELETE FROM tokenized_examples")
+                    self._conn.execute("ALTER TABLE tokenized_examples ADD COLUMN account TEXT NOT NULL DEFAULT ''")
+                    self._conn.execute("ALTER TABLE tokenized_examples ADD COLUMN last_run INTEGER NOT NULL DEFAULT 0")
+                    self._conn.execute("CREATE INDEX idx_tokenized_account ON tokenized_examples (account, last_run)")
+                    self._conn.execute("CREATE TABLE token_cache_runs (account TEXT PRIMARY KEY, run INTEGER NOT NULL)")
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def start_run(self, account: str) -> int:
+        """Numbers a new training run of the account"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO token_cache_runs (account, run) VALUES (?, 1) "
+                "ON CONFLICT (account) DO UPDATE SET run = run + 1",
+                (account,),
+            )
+            return self._conn.execute("SELECT run FROM token_cache_runs WHERE account = ?", (account,)).fetchone()[0]
+
+    def get_many(self, keys: list, account: str, run: int) -> dict:
+        """
+        Returns {key: (input_ids, prompt_length)} for the keys that are
+        cached, marking them used by the account's run
+        """
+        found = {}
+        with self._lock, self._conn:
+            # Stay well below SQLite's bound parameter limit
+            for offset in range(0, len(keys), 500):
+                chunk = keys[offset:offset + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, input_ids, prompt_length FROM tokenized_examples "
+                    f"WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, blob, prompt_length in rows:
+                    input_ids = array("i")
+                    input_ids.frombytes(blob)
+                    found[key] = (input_ids.tolist(), prompt_length)
+                self._conn.executemany(
+                    "UPDATE tokenized_examples SET account = ?, last_run = ? WHERE key = ?",
+                    ((account, run, key) for key, _, _ in rows),
+                )
+        return found
+
+    def put_many(self, entries, account: str, run: int):
+        """Stores (key, input_ids, prompt_length) tuples for the account's run"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tokenized_examples (key, input_ids, prompt_length, account, last_run) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    (key, array("i", input_ids).tobytes(), prompt_length, account, run)
+                    for key, input_ids, prompt_length in entries
+                ),
+            )
+
+    def prune(self, account: str, run: int, keep_runs: int = TOKEN_CACHE_KEEP_RUNS) -> int:
+        """Drops the account's entries not used by its last keep_runs runs; returns how many"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM tokenized_examples WHERE account = ? AND last_run <= ?",
+                (account, run - keep_runs),
+            ).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,129 +1,276 @@
+import gc
 import os
-from datasets import load_dataset
-from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, Trainer
+from datasets import Dataset, DatasetDict
+from transformers import (
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    DataCollatorForSeq2Seq,
+    TrainingArguments,
+    Trainer,
+    TrainerCallback,
+)
 from peft import LoraConfig, get_peft_model, PeftModel
 import torch
 from pathlib import Path
 import json
+import math
+from datetime import datetime
+from pair_store import PairStore
+from prompts import build_prompt, REVISED_MARKER
+from token_cache import TokenCache, example_key
+from adapter_store import account_dir, current_adapter, new_version_dir, publish_version, remove_old_versions
+# Same base model as inference (BASE_MODEL), so adapters always match it
+from generation_config import BASE_MODEL_NAME, INFERENCE_PRECISION
 
-# CONFIGURATION - Using Mistral as base model
-BASE_MODEL_NAME = "mistralai/Mistral-7B-Instruct-v0.2"
-DATA_FILE = "data/pairs.jsonl"
-BASE_OUTPUT_DIR = "outputs/tone_of_voice_lora"
+# CONFIGURATION
 MAX_LENGTH = 512
 
-def load_and_prepare_dataset(user_id: str, account_id: str):
+NUM_TRAIN_EPOCHS = 15
+
+# Incremental retraining: once an adapter has been trained, retrains use the
+# pairs logged since (tracked in TRAINING_STATE_FILE) plus a replay sample of
+# older pairs, and pick epochs so each run sees about INCREMENTAL_EXAMPLE_BUDGET examples
+TRAINING_STATE_FILE = "training_state.json"
+REPLAY_RATIO = 1.0  # Older pairs replayed per new pair
+REPLAY_MAX_EXAMPLES = 200
+INCREMENTAL_EXAMPLE_BUDGET = 600
+
+# Per-account bound on the pairs a run trains on (0 = no bound), so training
+# time and memory stay flat for large accounts. Above it, pairs are sampled with
+# a weight that halves every TRAIN_RECENCY_HALF_LIFE pairs back (0 = uniformly)
+TRAIN_MAX_PAIRS = int(os.getenv("TRAIN_MAX_PAIRS", 2000))
+TRAIN_RECENCY_HALF_LIFE = int(os.getenv("TRAIN_RECENCY_HALF_LIFE", 500))
+
+# How training examples are batched:
+#   single  - one example per step, 4 accumulated (the original setup)
+#   grouped - batches of similar-length examples, padded per batch
+#   packed  - examples packed together into sequences of up to MAX_LENGTH tokens
+TRAIN_BATCHING = os.getenv("TRAIN_BATCHING", "grouped")
+# Examples (or packed sequences) per forward pass, rounded down to a divisor of
+# EFFECTIVE_BATCH_SIZE; gradients are accumulated up to EFFECTIVE_BATCH_SIZE per
+# optimizer step either way. "auto" starts at EFFECTIVE_BATCH_SIZE and halves on
+# CUDA out-of-memory
+TRAIN_BATCH_SIZE = os.getenv("TRAIN_BATCH_SIZE", "auto")
+EFFECTIVE_BATCH_SIZE = 4
+WARMUP_RATIO = 0.1
+
+# Tokenization worker processes, used once this many examples need tokenizing
+TOKENIZE_NUM_PROC = int(os.getenv("TOKENIZE_NUM_PROC", os.cpu_count() or 1))
+TOKENIZE_PARALLEL_MIN_EXAMPLES = 2000
+
+class TrainingCancelled(Exception):
+    """Raised inside the training loop when the job was cancelled"""
+
+class ProgressCallback(TrainerCallback):
+    """Reports Trainer progress and stops training when cancellation is requested"""
+
+    def __init__(self, on_progress=None, should_cancel=None):
+        self.on_progress = on_progress
+        self.should_cancel = should_cancel
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self.on_progress:
+            self.on_progress(state.global_step, state.max_steps)
+        if self.should_cancel and self.should_cancel():
+            raise TrainingCancelled()
+
+def read_training_state(output_dir: Path) -> dict:
+    """The watermark written after the adapter in output_dir was last trained, if any"""
+    state_path = Path(output_dir) / TRAINING_STATE_FILE
+    if not state_path.exists() or not (Path(output_dir) / "adapter_config.json").exists():
+        return None
+    with state_path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_training_state(output_dir: Path, state: dict):
+    state_path = Path(output_dir) / TRAINING_STATE_FILE
+    temp_path = state_path.with_name(state_path.name + ".tmp")
+    with temp_path.open("w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(temp_path, state_path)
+
+def incremental_epochs(num_examples: int) -> int:
+    """Epochs for an incremental run, so its cost stays flat as history grows"""
+    return max(1, min(NUM_TRAIN_EPOCHS, round(INCREMENTAL_EXAMPLE_BUDGET / num_examples)))
+
+def load_and_prepare_dataset(user_id: str, account_id: str, after_id: int = None):
     """
-    Loads data/pairs.jsonl with fields 'draft' and 'final'
-    Filters for specific user/account and formats for Causal-Language-Model.
+    Loads the user/account's pairs (fields 'id', 'draft' and 'final') from
+    the pair store and formats them for Causal-Language-Model. Returns the
+    dataset and the id of the newest pair considered, or (None, None) if
+    there are no new pairs.
+
+    With after_id, only pairs logged after it are loaded, plus a random
+    replay sample of older ones. Either way at most TRAIN_MAX_PAIRS are
+    used, recency-weighted.
     """
-    if not os.path.exists(DATA_FILE):
-        raise FileNotFoundError(f"{DATA_FILE} not found. Collect data first with log_pair().")
-
-    # Load all data
-    all_data = []
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                record = json.loads(line)
-                # Filter for this user/account
-                if record.get("userId") == user_id and record.get("accountId") == account_id:
-                    all_data.append(record)
-            except:
-                continue
-
-    if len(all_data) < 10:
+    store = PairStore()
+    try:
+        last_id = store.last_pair_id(user_id, account_id)
+        all_data = store.sample_pairs(
+            user_id, account_id, last_id, TRAIN_MAX_PAIRS or None,
+            after_id=after_id or 0, half_life=TRAIN_RECENCY_HALF_LIFE,
+        )
+        if after_id is not None and all_data:
+            replay_limit = min(REPLAY_MAX_EXAMPLES, math.ceil(len(all_data) * REPLAY_RATIO))
+            if TRAIN_MAX_PAIRS:
+                replay_limit = min(replay_limit, TRAIN_MAX_PAIRS - len(all_data))
+            if replay_limit > 0:
+                all_data = store.sample_pairs(user_id, account_id, after_id, replay_limit) + all_data
+    finally:
+        store.close()
+
+    if after_id is not None:
+        if not all_data:
+            return None, None
+    elif len(all_data) < 10:
         raise ValueError(f"Need at least 10 examples. Found {len(all_data)} for user {user_id}, account {account_id}")
 
-    # Create temporary JSON file for this user
-    temp_file = f"data/temp_{user_id}_{account_id}.jsonl"
-    with open(temp_file, "w", encoding="utf-8") as f:
-        for record in all_data:
-            f.write(json.dumps({"draft": record["draft"], "final": record["final"]}, ensure_ascii=False) + "\n")
-
-    ds = load_dataset("json", data_files={"train": temp_file})
-
-    def format_example(example):
-        draft = example["draft"].strip()
-        final = example["final"].strip()
-
-        full_text = (
-            "You are an email assistant. "
-            "You receive a draft email reply and should rewrite it to match the user's writing style.\n"
-            "IMPORTANT: Keep the exact meaning and content. Only change the style to match the user's preferences.\n\n"
-            "Draft reply:\n"
-            f"{draft}\n\n"
-            "Revised version:\n"
-            f"{final}"
-        )
-        return {"text": full_text}
+    def format_example(record):
+        draft = record["draft"].strip()
+        final = record["final"].strip()
 
-    ds = ds.map(format_example)
-    
-    # Clean up temp file
-    if os.path.exists(temp_file):
-        os.remove(temp_file)
+        return build_prompt(draft) + final
+
+    # Built in memory, so no intermediate file and no datasets cache entry per run
+    ds = DatasetDict({
+        "train": Dataset.from_dict({
+            "id": [record["id"] for record in all_data],
+            "draft": [record["draft"] for record in all_data],
+            "final": [record["final"] for record in all_data],
+            "text": [format_example(record) for record in all_data],
+        })
+    })
     
-    return ds
-
-def tokenize_dataset(dataset, tokenizer):
-    def tokenize_fn(example):
-        text = example["text"]
-        
-        # Find the position where "Revised version:" ends
-        prompt_end_marker = "Revised version:\n"
-        prompt_end = text.find(prompt_end_marker)
-        
+    return ds, last_id
+
+def tokenize_batch(batch, tokenizer):
+    """
+    Tokenizes a batch of formatted examples with the fast tokenizer. The
+    prompt (up to and including "Revised version:") and the final text are
+    tokenized separately; prompt_length marks the part masked out of the loss.
+    """
+    prompt_texts, final_texts, has_prompt = [], [], []
+    for text in batch["text"]:
+        prompt_end = text.find(REVISED_MARKER)
         if prompt_end == -1:
-            # Fallback: use entire text
-            encoded = tokenizer(text, max_length=MAX_LENGTH, truncation=True)
-            encoded["labels"] = encoded["input_ids"].copy()
-            return encoded
-        
-        # Split text into prompt and final
-        prompt_text = text[:prompt_end + len(prompt_end_marker)]
-        final_text = text[prompt_end + len(prompt_end_marker):]
-        
-        # Tokenize prompt and final separately
-        prompt_encoded = tokenizer(prompt_text, add_special_tokens=True)
-        final_encoded = tokenizer(final_text, add_special_tokens=False)
-        
-        # Combine (without duplicate special tokens)
-        input_ids = prompt_encoded["input_ids"] + final_encoded["input_ids"]
-        attention_mask = prompt_encoded["attention_mask"] + final_encoded["attention_mask"]
-        
-        # Truncate if too long
-        if len(input_ids) > MAX_LENGTH:
-            input_ids = input_ids[:MAX_LENGTH]
-            attention_mask = attention_mask[:MAX_LENGTH]
-        
-        # Labels: -100 for prompt part (ignored in loss), real IDs for final part
-        prompt_length = len(prompt_encoded["input_ids"])
-        labels = [-100] * prompt_length + input_ids[prompt_length:]
-        
-        # Ensure labels same length as input_ids
-        if len(labels) > len(input_ids):
-            labels = labels[:len(input_ids)]
-        elif len(labels) < len(input_ids):
-            labels = labels + [-100] * (len(input_ids) - len(labels))
-        
-        return {
-            "input_ids": input_ids,
-            "attention_mask": attention_mask,
-            "labels": labels,
-        }
-
-    tokenized = dataset.map(
-        tokenize_fn,
-        batched=False,
-        remove_columns=dataset["train"].column_names,
-    )
-    tokenized.set_format(type="torch")
+            # Fallback: train on the entire text
+            prompt_texts.append(text)
+            final_texts.append("")
+            has_prompt.append(False)
+        else:
+            split = prompt_end + len(REVISED_MARKER)
+            prompt_texts.append(text[:split])
+            final_texts.append(text[split:])
+            has_prompt.append(True)
+
+    prompts = tokenizer(prompt_texts, add_special_tokens=True)["input_ids"]
+    finals = tokenizer(final_texts, add_special_tokens=False)["input_ids"]
+
+    input_ids, prompt_lengths = [], []
+    for prompt_ids, final_ids, masked in zip(prompts, finals, has_prompt):
+        # Combine and truncate if too long
+        input_ids.append((prompt_ids + final_ids)[:MAX_LENGTH])
+        prompt_lengths.append(len(prompt_ids) if masked else 0)
+    return {"input_ids": input_ids, "prompt_length": prompt_lengths}
+
+def build_example(input_ids: list, prompt_length: int) -> dict:
+    """Labels: -100 for the prompt part (ignored in loss), real IDs for the final part"""
+    return {
+        "input_ids": input_ids,
+        "attention_mask": [1] * len(input_ids),
+        "labels": [-100] * min(prompt_length, len(input_ids)) + input_ids[prompt_length:],
+    }
+
+def tokenize_dataset(dataset, tokenizer, account: str):
+    """
+    Tokenizes the formatted examples, reusing cached tokenizations of pairs
+    seen in earlier runs of the account so only new pairs go through the
+    tokenizer, then prunes the account's stale cache entries.
+    """
+    texts = dataset["train"]["text"]
+    keys = [example_key(tokenizer.name_or_path, MAX_LENGTH, text) for text in texts]
+
+    cache = TokenCache()
+    try:
+        run = cache.start_run(account)
+        tokenized_by_key = cache.get_many(keys, account, run)
+        missing = [i for i, key in enumerate(keys) if key not in tokenized_by_key]
+        if missing:
+            subset = dataset["train"].select(missing)
+            encoded = subset.map(
+                tokenize_batch,
+                batched=True,
+                fn_kwargs={"tokenizer": tokenizer},
+                num_proc=TOKENIZE_NUM_PROC if len(missing) >= TOKENIZE_PARALLEL_MIN_EXAMPLES else None,
+                remove_columns=subset.column_names,
+            )
+            new_entries = [
+                (keys[i], input_ids, prompt_length)
+                for i, input_ids, prompt_length in zip(missing, encoded["input_ids"], encoded["prompt_length"])
+            ]
+            cache.put_many(new_entries, account, run)
+            tokenized_by_key.update((key, (input_ids, prompt_length)) for key, input_ids, prompt_length in new_entries)
+        pruned = cache.prune(account, run)
+    finally:
+        cache.close()
+    print(f"Tokenized {len(missing)} new examples, {len(keys) - len(missing)} from cache, pruned {pruned} stale")
+
+    examples = [build_example(*tokenized_by_key[key]) for key in keys]
+    tokenized = DatasetDict({
+        "train": Dataset.from_dict({
+            column: [example[column] for example in examples]
+            for column in ("input_ids", "attention_mask", "labels")
+        })
+    })
     return tokenized
 
+def pack_examples(dataset, max_length: int = MAX_LENGTH):
+    """
+    Packs tokenized examples into sequences of up to max_length tokens
+    (first-fit, longest first). Examples are never split and keep their
+    prompt label masking; packed examples can attend to each other.
+    """
+    columns = ("input_ids", "attention_mask", "labels")
+    data = {column: dataset[column] for column in columns}
+    order = sorted(range(len(dataset)), key=lambda i: len(data["input_ids"][i]), reverse=True)
+    bins = []  # [{column: values}]
+    for i in order:
+        length = len(data["input_ids"][i])
+        target = next((b for b in bins if len(b["input_ids"]) + length <= max_length), None)
+        if target is None:
+            target = {column: [] for column in columns}
+            bins.append(target)
+        for column in columns:
+            target[column].extend(data[column][i])
+    print(f"Packed {len(dataset)} examples into {len(bins)} sequences")
+    return Dataset.from_dict({column: [b[column] for b in bins] for column in columns})
+
+def batching_arguments(batching: str, batch_size: int = None) -> dict:
+    """
+    TrainingArguments batch settings for a TRAIN_BATCHING mode, with
+    batch_size overriding TRAIN_BATCH_SIZE. The batch size is rounded down
+    to a divisor of EFFECTIVE_BATCH_SIZE and accumulation makes up the
+    rest, so every optimizer step sees exactly EFFECTIVE_BATCH_SIZE
+    examples (or packed sequences) whatever the batch size.
+    """
+    if batching == "single":
+        batch_size = 1
+    elif batch_size is None:
+        batch_size = EFFECTIVE_BATCH_SIZE if TRAIN_BATCH_SIZE == "auto" else int(TRAIN_BATCH_SIZE)
+    divisor = max(size for size in range(1, EFFECTIVE_BATCH_SIZE + 1)
+                  if EFFECTIVE_BATCH_SIZE % size == 0 and size <= max(batch_size, 1))
+    if divisor != batch_size:
+        print(f"Using batch size {divisor} instead of {batch_size}, a divisor of the effective batch of {EFFECTIVE_BATCH_SIZE}")
+    return {
+        "per_device_train_batch_size": divisor,
+        "gradient_accumulation_steps": EFFECTIVE_BATCH_SIZE // divisor,
+        "group_by_length": batching == "grouped",
+    }
+
 def create_lora_model(user_id: str, account_id: str):
     """Create or load LoRA model for specific user/account"""
-    output_dir = Path(BASE_OUTPUT_DIR) / f"{user_id}_{account_id}"
+    output_dir = account_dir(f"{user_id}_{account_id}")
     output_dir.mkdir(parents=True, exist_ok=True)
     
     # Load base Mistral model
@@ -135,13 +282,13 @@ def create_lora_model(user_id: str, account_id: str):
         low_cpu_mem_usage=True,
     )
 
-    # If adapter already exists, load and continue training
-    adapter_config_path = output_dir / "adapter_config.json"
-    if adapter_config_path.exists():
-        print(f"Loading existing LoRA adapter from {output_dir}...")
+    # If an adapter was published already, load and continue training
+    version, adapter_path = current_adapter(output_dir)
+    if version is not None:
+        print(f"Loading existing LoRA adapter from {adapter_path}...")
         model = PeftModel.from_pretrained(
             base_model,
-            str(output_dir),
+            str(adapter_path),
             is_trainable=True,
         )
         model.print_trainable_parameters()
@@ -162,51 +309,153 @@ def create_lora_model(user_id: str, account_id: str):
     model.print_trainable_parameters()
     return model, str(output_dir)
 
-def train_model(user_id: str, account_id: str):
-    """Train model for specific user/account"""
+def train_model(user_id: str, account_id: str, on_progress=None, should_cancel=None,
+                full_retrain: bool = False, batching: str = None):
+    """
+    Train model for specific user/account.
+    batching overrides TRAIN_BATCHING ("single", "grouped" or "packed").
+    If the account's adapter was trained before, only pairs logged since
+    then (plus a replay sample) are used, unless full_retrain is set.
+    on_progress(step, max_steps) is called after every optimizer step;
+    training stops with TrainingCancelled once should_cancel() returns True.
+    """
     print(f"Starting training for user {user_id}, account {account_id}")
     
-    dataset = load_and_prepare_dataset(user_id, account_id)
+    _, adapter_path = current_adapter(account_dir(f"{user_id}_{account_id}"))
+    state = None if full_retrain or adapter_path is None else read_training_state(adapter_path)
+    after_id = state["last_pair_id"] if state else None
+    dataset, last_id = load_and_prepare_dataset(user_id, account_id, after_id)
+    if dataset is None:
+        print(f"No new pairs since the last training (pair {after_id}), nothing to do")
+        return {"examples": 0, "new_examples": 0, "incremental": True}
+
+    pair_ids = dataset["train"]["id"]
+    new_examples = len(pair_ids) if after_id is None else sum(1 for pair_id in pair_ids if pair_id > after_id)
+    num_epochs = NUM_TRAIN_EPOCHS if after_id is None else incremental_epochs(len(pair_ids))
+    if after_id is not None:
+        print(f"Incremental training: {new_examples} new pairs, {len(pair_ids) - new_examples} replayed, {num_epochs} epochs")
 
     tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL_NAME)
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token
 
-    tokenized = tokenize_dataset(dataset, tokenizer)
+    # Pad on the right so positions of the real tokens match unpadded training
+    tokenizer.padding_side = "right"
+
+    batching = batching or TRAIN_BATCHING
+    if batching not in ("single", "grouped", "packed"):
+        raise ValueError(f"Unknown batching mode: {batching}")
+    tokenized = tokenize_dataset(dataset, tokenizer, f"{user_id}_{account_id}")
+    train_dataset = pack_examples(tokenized["train"]) if batching == "packed" else tokenized["train"]
     model, output_dir = create_lora_model(user_id, account_id)
 
-    training_args = TrainingArguments(
-        output_dir=output_dir,
-        per_device_train_batch_size=1,
-        gradient_accumulation_steps=4,  # Effective batch size = 4
-        learning_rate=5e-5,
-        num_train_epochs=15,
-        logging_steps=5,
-        save_strategy="epoch",
-        fp16=torch.cuda.is_available(),
-        bf16=False,
-        optim="adamw_torch",
-        warmup_steps=30,
-        save_total_limit=3,
-        lr_scheduler_type="cosine",
+    # Pads each batch to its longest sequence; padded label positions get -100
+    data_collator = DataCollatorForSeq2Seq(
+        tokenizer,
+        padding=True,
+        label_pad_token_id=-100,
+        pad_to_multiple_of=None if batching == "single" else 8,
     )
 
-    trainer = Trainer(
-        model=model,
-        args=training_args,
-        train_dataset=tokenized["train"],
-    )
+    batch_arguments = batching_arguments(batching)
+    while True:
+        training_args = TrainingArguments(
+            # Checkpoints stay out of the published versions
+            output_dir=str(Path(output_dir) / "checkpoints"),
+            **batch_arguments,
+            learning_rate=5e-5,
+            num_train_epochs=num_epochs,
+            logging_steps=5,
+            save_strategy="epoch",
+            fp16=torch.cuda.is_available(),
+            bf16=False,
+            optim="adamw_torch",
+            # A ratio, since a run can be as short as a few dozen steps
+            warmup_ratio=WARMUP_RATIO,
+            save_total_limit=3,
+            lr_scheduler_type="cosine",
+        )
+
+        trainer = Trainer(
+            model=model,
+            args=training_args,
+            train_dataset=train_dataset,
+            data_collator=data_collator,
+            callbacks=[ProgressCallback(on_progress, should_cancel)],
+        )
+
+        try:
+            train_result = trainer.train()
+            break
+        except torch.cuda.OutOfMemoryError:
+            # grouped puts its longest batch first, so this happens on the first steps
+            batch_size = batch_arguments["per_device_train_batch_size"]
+            if TRAIN_BATCH_SIZE != "auto" or batch_size == 1:
+                raise
+            del trainer
+            torch.cuda.empty_cache()
+            batch_arguments = batching_arguments(batching, batch_size // 2)
+            print(f"Out of memory with batch size {batch_size}, retrying with {batch_size // 2}")
+    # Save into a new version directory and only publish it once complete,
+    # so the server never loads a half-written adapter
+    version, version_dir = new_version_dir(output_dir)
+    trainer.save_model(str(version_dir))
+    tokenizer.save_pretrained(str(version_dir))
+    batch_size = trainer._train_batch_size
+    if INFERENCE_PRECISION == "int8-merged":
+        # Before publishing, so the served version always has its merged model;
+        # the training copy of the model is freed first
+        from revise_response import export_merged_model
+        del trainer, model
+        gc.collect()
+        export_merged_model(str(version_dir))
+    write_training_state(version_dir, {
+        # Pairs left out by TRAIN_MAX_PAIRS sampling are not retried next time
+        "last_pair_id": last_id,
+        "trained_at": datetime.utcnow().isoformat(),
+        "examples": len(pair_ids),
+        "new_examples": new_examples,
+        "epochs": num_epochs,
+    })
+    publish_version(output_dir, version)
+    removed = remove_old_versions(output_dir)
+    print(f"Training complete. Adapter {version} published in {output_dir}"
+          + (f" (removed old versions: {', '.join(removed)})" if removed else ""))
+
+    runtime = train_result.metrics["train_runtime"]
+    num_tokens = sum(len(ids) for ids in train_dataset["input_ids"]) * training_args.num_train_epochs
+    metrics = {
+        "examples": len(pair_ids),
+        "version": version,
+        "batching": batching,
+        "batch_size": batch_size,
+        "new_examples": new_examples,
+        "incremental": after_id is not None,
+        "epochs": num_epochs,
+        "train_runtime": runtime,
+        "train_steps_per_second": train_result.metrics["train_steps_per_second"],
+        "tokens_per_second": num_tokens / runtime if runtime else 0.0,
+    }
+    print(f"Training throughput ({batching}, batch size {metrics['batch_size']}): "
+          f"{metrics['tokens_per_second']:.1f} tokens/sec")
+    return metrics
 
-    trainer.train()
-    trainer.save_model(output_dir)
-    tokenizer.save_pretrained(output_dir)
-    print(f"Training complete. Adapter saved to {output_dir}")
+def export_published_merged_model(user_id: str, account_id: str):
+    """Exports the merged int8 model of an adapter published without one (e.g. before INFERENCE_PRECISION=int8-merged)"""
+    from revise_response import export_merged_model
+    version, adapter_path = current_adapter(account_dir(f"{user_id}_{account_id}"))
+    if version is None:
+        raise FileNotFoundError(f"No published adapter for user {user_id}, account {account_id}")
+    export_merged_model(str(adapter_path))
 
 if __name__ == "__main__":
     import sys
     if len(sys.argv) < 3:
-        print("Usage: python train_tone_of_voice.py <user_id> <account_id>")
+        print("Usage: python train_tone_of_voice.py <user_id> <account_id> [--full | --export-merged]")
         sys.exit(1)
     
-    train_model(sys.argv[1], sys.argv[2])
+    if "--export-merged" in sys.argv[3:]:
+        export_published_merged_model(sys.argv[1], sys.argv[2])
+    else:
+        train_model(sys.argv[1], sys.argv[2], full_retrain="--full" in sys.argv[3:])
 
@@ -0,0 +1,361 @@
+import multiprocessing
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+JOBS_DB_PATH = Path("data/jobs.db")
+
+ACTIVE_STATES = ("queued", "running")
+
+# A running job whose dispatcher hasn't reported in this long is requeued. Not
+# a PID check: a restarted container usually gets the same PID back
+ORPHAN_TIMEOUT_SECONDS = 60
+
+# Version of the schema after _migrate_schema(), kept in PRAGMA user_version
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS training_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    step INTEGER NOT NULL DEFAULT 0,
+    max_steps INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    owner_pid INTEGER,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_account ON training_jobs (user_id, account_id, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON training_jobs (state, id);
+"""
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+
+class TrainingJobStore:
+    """
+    Persistent training job records in SQLite.
+
+    Jobs move through queued -> running -> done/failed/cancelled. At most one
+    queued or running job exists per user/account; enqueueing again returns
+    the existing one.
+    """
+
+    def __init__(self, db_path: Path = JOBS_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.db_path), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate_schema()
+
+    def _migrate_schema(self):
+        """Brings the database up to SCHEMA_VERSION, one version at a time"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+                if version < 1:
+                    # The dispatcher instance running a job, and when it last reported in
+                    self._conn.execute("ALTER TABLE training_jobs ADD COLUMN owner_instance TEXT")
+                    self._conn.execute("ALTER TABLE training_jobs ADD COLUMN heartbeat_at TEXT")
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _job(self, row) -> dict:
+        if row is None:
+            return None
+        job = dict(row)
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["progress"] = round(job["step"] / job["max_steps"], 3) if job["max_steps"] else 0.0
+        return job
+
+    def enqueue(self, user_id: str, account_id: str):
+        """Queue a training job unless one is already active. Returns (job, created)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM training_jobs WHERE user_id = ? AND account_id = ? "
+                    "AND state IN ('queued', 'running') ORDER BY id DESC LIMIT 1",
+                    (user_id, account_id),
+                ).fetchone()
+                created = row is None
+                if created:
+                    cursor = self._conn.execute(
+                        "INSERT INTO training_jobs (user_id, account_id, state, created_at) VALUES (?, ?, 'queued', ?)",
+                        (user_id, account_id, _now()),
+                    )
+                    row = self._conn.execute(
+                        "SELECT * FROM training_jobs WHERE id = ?", (cursor.lastrowid,)
+                    ).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._job(row), created
+
+    def get(self, job_id: int) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM training_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row)
+
+    def latest_for_account(self, user_id: str, account_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM training_jobs WHERE user_id = ? AND account_id = ? ORDER BY id DESC LIMIT 1",
+                (user_id, account_id),
+            ).fetchone()
+        return self._job(row)
+
+    def claim_next(self, max_running: int, owner_instance: str) -> dict:
+        """
+        Atomically move the oldest queued job to running, respecting the
+        global limit; the job is owned by the dispatcher owner_instance
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                running = self._conn.execute(
+                    "SELECT COUNT(*) FROM training_jobs WHERE state = 'running'"
+                ).fetchone()[0]
+                row = None
+                if running < max_running:
+                    # Never claimed: queued with a cancel pending (requeued before requeue() honoured it)
+                    self._conn.execute(
+                        "UPDATE training_jobs SET state = 'cancelled', finished_at = ? "
+                        "WHERE state = 'queued' AND cancel_requested = 1",
+                        (_now(),),
+                    )
+                    row = self._conn.execute(
+                        "SELECT * FROM training_jobs WHERE state = 'queued' ORDER BY id LIMIT 1"
+                    ).fetchone()
+                if row is not None:
+                    now = _now()
+                    self._conn.execute(
+                        "UPDATE training_jobs SET state = 'running', owner_pid = ?, owner_instance = ?, "
+                        "started_at = ?, heartbeat_at = ?, step = 0, max_steps = 0 WHERE id = ?",
+                        (os.getpid(), owner_instance, now, now, row["id"]),
+                    )
+                    row = self._conn.execute("SELECT * FROM training_jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._job(row)
+
+    def heartbeat(self, owner_instance: str):
+        """Marks the running jobs of a dispatcher instance as still owned"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE training_jobs SET heartbeat_at = ? WHERE owner_instance = ? AND state = 'running'",
+                (_now(), owner_instance),
+            )
+
+    def update_progress(self, job_id: int, step: int, max_steps: int):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE training_jobs SET step = ?, max_steps = ? WHERE id = ?",
+                (step, max_steps, job_id),
+            )
+
+    def finish(self, job_id: int, state: str, error: str = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE training_jobs SET state = ?, error = ?, finished_at = ? WHERE id = ? AND state = 'running'",
+                (state, error, _now(), job_id),
+            )
+
+    def request_cancel(self, job_id: int) -> dict:
+        """Cancel a queued job immediately; flag a running job so its worker stops at the next step"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE training_jobs SET state = 'cancelled', finished_at = ? WHERE id = ? AND state = 'queued'",
+                (_now(), job_id),
+            )
+            self._conn.execute(
+                "UPDATE training_jobs SET cancel_requested = 1 WHERE id = ? AND state = 'running'",
+                (job_id,),
+            )
+        return self.get(job_id)
+
+    def is_cancel_requested(self, job_id: int) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cancel_requested FROM training_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def requeue(self, job_id: int):
+        """
+        Put a running job back in the queue (its worker was stopped, not
+        failed), or mark it cancelled if a cancel was requested meanwhile
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE training_jobs SET state = 'cancelled', finished_at = ? "
+                "WHERE id = ? AND state = 'running' AND cancel_requested = 1",
+                (_now(), job_id),
+            )
+            self._conn.execute(
+                "UPDATE training_jobs SET state = 'queued', owner_pid = NULL, owner_instance = NULL, "
+                "started_at = NULL, heartbeat_at = NULL WHERE id = ? AND state = 'running'",
+                (job_id,),
+            )
+
+    def requeue_orphans(self, owner_instance: str) -> int:
+        """
+        Requeue (see requeue()) running jobs owned by another dispatcher
+        instance that stopped reporting in, i.e. one from before a restart or crash
+        """
+        cutoff = (datetime.utcnow() - timedelta(seconds=ORPHAN_TIMEOUT_SECONDS)).isoformat()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM training_jobs WHERE state = 'running' "
+                "AND (owner_instance IS NULL OR owner_instance != ?) "
+                "AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (owner_instance, cutoff),
+            ).fetchall()
+        for row in rows:
+            self.requeue(row["id"])
+        return len(rows)
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) AS n FROM training_jobs GROUP BY state"
+            ).fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def run_training_job(job_id: int, user_id: str, account_id: str, db_path: str):
+    """Worker process entry point: trains one account and records the outcome"""
+    # Imported here so only the worker process pays for the ML stack
+    from train_tone_of_voice import train_model, TrainingCancelled
+
+    store = TrainingJobStore(Path(db_path))
+    try:
+        train_model(
+            user_id,
+            account_id,
+            on_progress=lambda step, max_steps: store.update_progress(job_id, step, max_steps),
+            should_cancel=lambda: store.is_cancel_requested(job_id),
+        )
+        store.finish(job_id, "done")
+    except TrainingCancelled:
+        print(f"Training job {job_id} cancelled")
+        store.finish(job_id, "cancelled")
+    except Exception as e:
+        print(f"Training job {job_id} failed: {e}")
+        store.finish(job_id, "failed", str(e))
+    finally:
+        store.close()
+
+
+class TrainingJobDispatcher:
+    """
+    Starts queued jobs in separate worker processes.
+
+    A background thread polls the job store, launches up to max_concurrent
+    workers and reaps finished ones. on_complete(job) is called in this
+    process for every job that ends in state "done".
+
+    Each dispatcher gets its own instance id and keeps the jobs it runs
+    marked with a heartbeat, so jobs left running by a dispatcher that went
+    away (a crash, a restart) are requeued, even if the new process reuses
+    the old PID.
+    """
+
+    def __init__(self, store: TrainingJobStore, max_concurrent: int, poll_interval: float = 1.0, on_complete=None):
+        self.store = store
+        self.max_concurrent = max_concurrent
+        self.poll_interval = poll_interval
+        self.on_complete = on_complete
+        self.instance_id = uuid.uuid4().hex
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = {}  # {job_id: Process}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._requeue_orphans()
+        self._thread = threading.Thread(target=self._run, name="training-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        # Interrupted jobs go back to the queue and run again after restart (unless cancelled)
+        for job_id, process in self._workers.items():
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            self.store.requeue(job_id)
+        self._workers.clear()
+
+    def _requeue_orphans(self):
+        requeued = self.store.requeue_orphans(self.instance_id)
+        if requeued:
+            print(f"Requeued or cancelled {requeued} training job(s) interrupted by a restart")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.store.heartbeat(self.instance_id)
+                # Also after startup: a previous instance's jobs may only time out now
+                self._requeue_orphans()
+                self._reap()
+                self._launch()
+            except Exception as e:
+                print(f"Training dispatcher error: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _reap(self):
+        for job_id, process in list(self._workers.items()):
+            if process.is_alive():
+                continue
+            del self._workers[job_id]
+            # The worker records its own outcome; a crash leaves the job running
+            self.store.finish(job_id, "failed", f"Worker exited with code {process.exitcode}")
+            job = self.store.get(job_id)
+            if job["state"] == "done" and self.on_complete:
+                self.on_complete(job)
+
+    def _launch(self):
+        while len(self._workers) < self.max_concurrent:
+            job = self.store.claim_next(self.max_concurrent, self.instance_id)
+            if job is None:
+                return
+            print(f"Starting training job {job['id']} for user {job['user_id']}, account {job['account_id']}")
+            process = self._context.Process(
+                target=run_training_job,
+                args=(job["id"], job["user_id"], job["account_id"], str(self.store.db_path)),
+                name=f"training-job-{job['id']}",
+            )
+            process.start()
+            self._workers[job["id"]] = process
+
+    def running_jobs(self) -> list:
+        return list(self._workers)